@@ -1,78 +1,798 @@
-from fastapi import FastAPI, UploadFile, Form
-from fastapi.middleware.cors import CORSMiddleware
-import shutil, os
-import numpy as np
-
-from color_engine import preprocess_roi, extract_lab_stats
-from grouping import assign_shade_group
-from data_store import save_results
-
-app = FastAPI()
-@app.get("/")
-def root():
-    return {"status": "Shade QC backend running"}
-
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+from fastapi import (
+    APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException,
+    WebSocket, WebSocketDisconnect,
 )
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import asyncio, hashlib, io, json, os, re, tempfile, zipfile
+from datetime import datetime
+
+from workers import get_executor, ExecutorSaturated
+from metrics import REGISTRY, render_metrics, stage
+
+# Routes only. The app itself is built by main.create_app().
+# OpenCV / numpy / scipy / xlsxwriter modules are imported inside the
+# handlers that use them, so importing the routes is cheap; the app's
+# lifespan loads them at startup (or on first request).
+# Async handlers never call SQLite directly: store and registry calls go
+# through run_in_threadpool, so a busy database cannot stall the loop.
+router = APIRouter()
 
 UPLOAD_DIR = "IMAGES"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-MASTER_LAB = None
+# Keep a copy of every upload on disk (written after the response is sent)
+ARCHIVE_UPLOADS = os.environ.get("SHADE_QC_ARCHIVE_UPLOADS", "1") != "0"
+
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+
 
-@app.post("/set-master")
-async def set_master(image: UploadFile):
-    global MASTER_LAB
-    path = f"{UPLOAD_DIR}/master.jpg"
+def archive_path(name):
+    """
+    UPLOAD_DIR/<name>.jpg for a client-supplied name (roll number, master
+    key). Anything but letters, digits, ".", "_" and "-" is replaced, so
+    the file always lands directly in UPLOAD_DIR; altered names get a
+    short hash of the original to keep them distinct.
+    """
+    safe = _UNSAFE_NAME.sub("_", name).lstrip(".")[:100] or "upload"
+    if safe != name:
+        safe += "_" + hashlib.blake2b(name.encode(), digest_size=4).hexdigest()
+    return os.path.join(UPLOAD_DIR, f"{safe}.jpg")
+
+
+def archive_upload(path, data):
+    """
+    Writes the original upload bytes to disk. Runs as a background task.
+    UPLOAD_DIR itself is created at startup.
+    """
     with open(path, "wb") as f:
-        shutil.copyfileobj(image.file, f)
+        f.write(data)
+
+    # Summary dialogs then open from the thumbnail cache straight away
+    from thumbnails import THUMBS_ON_UPLOAD, save_thumbnail
+
+    if THUMBS_ON_UPLOAD:
+        save_thumbnail(data)
+
+
+def schedule_archive(background_tasks, name, data):
+    if ARCHIVE_UPLOADS:
+        path = archive_path(name)
+        background_tasks.add_task(archive_upload, path, data)
+        return path
+    return None
+
+
+def cache_key(data):
+    from color_engine import analysis_params
+    from result_cache import make_key
+
+    return make_key(data, **analysis_params())
+
+
+async def measure_upload(data):
+    """
+    Dispatches the colour pipeline to the analysis executor and returns
+    (mean_lab, std_lab, tile_means). Repeat images are served from the
+    Lab stats cache. Answers 503 when the executor is saturated.
+    """
+    from color_engine import analyze_image
+    from result_cache import get_cache
+
+    cache = get_cache()
+    with stage("cache_lookup"):
+        key = cache_key(data)
+        cached = cache.get(key)
+
+    if cached is not None:
+        mean_lab, std_lab, tile_means = cached
+    else:
+        try:
+            with stage("analyze"):
+                mean_lab, std_lab, _, tile_means = await get_executor().run(analyze_image, data)
+        except ExecutorSaturated:
+            raise HTTPException(
+                status_code=503,
+                detail="Analysis queue full, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        if mean_lab is None:
+            raise HTTPException(status_code=400, detail="Could not decode image")
+
+        cache.put(key, mean_lab, std_lab, tile_means)
+
+    return mean_lab, std_lab, tile_means
+
+
+def resolve_master(mean_lab, master_id=None, nearest=False,
+                   buyer=None, contract=None, colourway=None):
+    """
+    Picks the master a roll is judged against:
+    explicit master_id, else the nearest master in Lab space when asked,
+    else the buyer/contract/colourway master, else the default master.
+    """
+    from master_registry import get_registry
+
+    registry = get_registry()
+
+    if master_id is not None:
+        master = registry.get_by_id(master_id)
+        if master is None:
+            raise HTTPException(status_code=404, detail=f"No master with id {master_id}")
+        return master
+
+    if nearest:
+        found = registry.nearest(mean_lab)
+        master = found[0][0] if found else None
+    else:
+        master = registry.get(buyer, contract, colourway) or registry.get()
+
+    if master is None:
+        raise HTTPException(status_code=400, detail="Master shade not set")
+    return master
+
+
+def master_info(master):
+    return {
+        "id": master["id"],
+        "buyer": master["buyer"],
+        "contract": master["contract"],
+        "colourway": master["colourway"],
+        "lab": [round(float(v), 2) for v in master["lab"]],
+    }
+
+
+def lab_stats_info(mean_lab):
+    """
+    Robust Lab summary of a roll (median, percentiles, rejected
+    fraction, ...), or None when robust stats are off.
+    """
+    from color_engine import LabStats
+
+    return mean_lab.to_dict() if isinstance(mean_lab, LabStats) else None
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    from result_cache import get_cache
+
+    return get_cache().stats()
+
+
+# =================================================
+# METRICS (Prometheus scrape endpoint)
+# =================================================
+
+REGISTRY.gauge(
+    "shade_qc_executor_pending", "Analysis jobs running or waiting",
+    lambda: get_executor().pending,
+)
+REGISTRY.gauge(
+    "shade_qc_executor_capacity", "Analysis jobs allowed in flight",
+    lambda: get_executor().max_pending,
+)
 
-    roi = preprocess_roi(path)
-    MASTER_LAB, _ = extract_lab_stats(roi)
 
-    return {"status": "Master shade set"}
+def _cache_stat(name):
+    def read():
+        from result_cache import get_cache
 
-@app.post("/analyze")
+        return get_cache().stats()[name]
+    return read
+
+
+REGISTRY.gauge(
+    "shade_qc_cache_hits_total", "Lab stats cache hits",
+    _cache_stat("hits"), kind="counter",
+)
+REGISTRY.gauge(
+    "shade_qc_cache_misses_total", "Lab stats cache misses",
+    _cache_stat("misses"), kind="counter",
+)
+REGISTRY.gauge(
+    "shade_qc_cache_evictions_total", "Lab stats cache evictions",
+    _cache_stat("evictions"), kind="counter",
+)
+REGISTRY.gauge(
+    "shade_qc_cache_entries", "Entries in the Lab stats cache",
+    _cache_stat("entries"),
+)
+REGISTRY.gauge(
+    "shade_qc_cache_hit_ratio", "Lab stats cache hit ratio since start",
+    _cache_stat("hit_rate"),
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Request counts and latency, per-stage timings, executor queue and
+    cache counters in Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@router.post("/set-master")
+async def set_master(
+    image: UploadFile,
+    background_tasks: BackgroundTasks,
+    buyer: Optional[str] = Form(None),
+    contract: Optional[str] = Form(None),
+    colourway: Optional[str] = Form(None),
+):
+    """
+    Registers the master for a buyer/contract/colourway
+    (no fields = the default master).
+    """
+    from master_registry import get_registry
+
+    data = await image.read()
+
+    mean_lab, _, _ = await measure_upload(data)
+
+    name = "_".join(v for v in (buyer, contract, colourway) if v) or "default"
+    path = schedule_archive(background_tasks, f"master_{name}", data)
+
+    master = await run_in_threadpool(
+        get_registry().set_master, mean_lab, buyer, contract, colourway, path
+    )
+
+    return {"status": "Master shade set", "master": master_info(master)}
+
+
+@router.get("/masters")
+def list_masters():
+    from master_registry import get_registry
+
+    return [master_info(m) for m in get_registry().all()]
+
+@router.post("/analyze")
 async def analyze_roll(
+    background_tasks: BackgroundTasks,
     roll_no: str = Form(...),
     quantity: float = Form(...),
-    image: UploadFile = Form(...)
+    image: UploadFile = Form(...),
+    buyer: Optional[str] = Form(None),
+    supplier: Optional[str] = Form(None),
+    contract: Optional[str] = Form(None),
+    lot: Optional[str] = Form(None),
+    colourway: Optional[str] = Form(None),
+    master_id: Optional[int] = Form(None),
+    nearest_master: bool = Form(False),
 ):
-    path = f"{UPLOAD_DIR}/{roll_no}.jpg"
-    with open(path, "wb") as f:
-        shutil.copyfileobj(image.file, f)
+    from color_engine import delta_e_2000, tile_uniformity
+    from grouping import assign_shade_group
+    from data_store import save_results
 
-    roi = preprocess_roi(path)
-    mean_lab, _ = extract_lab_stats(roi)
+    with stage("upload_read"):
+        data = await image.read()
 
-    from color_engine import delta_e_2000
-    delta_e = delta_e_2000(mean_lab, MASTER_LAB)
+    mean_lab, _, tile_means = await measure_upload(data)
+
+    with stage("master_lookup"):
+        master = await run_in_threadpool(
+            resolve_master, mean_lab, master_id, nearest_master, buyer, contract, colourway
+        )
+    delta_e = delta_e_2000(mean_lab, master["lab"])
+
+    uniformity = None
+    if tile_means is not None:
+        with stage("uniformity"):
+            uniformity = tile_uniformity(tile_means, mean_lab, master["lab"])
 
     shade, decision = assign_shade_group(delta_e)
 
-    result = [{
+    path = schedule_archive(background_tasks, roll_no, data)
+
+    result = {
         "roll_no": roll_no,
-        "lab": mean_lab,
-        "delta_e": delta_e,
+        "lab": [round(float(v), 2) for v in mean_lab],
+        "lab_stats": lab_stats_info(mean_lab),
+        "delta_e": round(delta_e, 2),
         "shade_group": shade,
         "decision": decision,
         "quantity": quantity,
-        "image": path
-    }]
+        "image": path,
+        "uniformity": uniformity,
+        "master": master_info(master)
+    }
+
+    with stage("persist"):
+        await run_in_threadpool(save_results, [dict(
+            result,
+            lab=mean_lab,
+            image_path=path,
+            buyer=buyer,
+            supplier=supplier,
+            contract=contract,
+            lot=lot,
+        )])
+
+    return result
+
+
+# =================================================
+# BULK ANALYSIS (NDJSON stream, one result line per roll)
+# =================================================
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+ROLL_META_FIELDS = ("buyer", "supplier", "contract", "lot", "colourway")
+
+
+def read_zip_images(data):
+    """
+    Returns [(filename, bytes)] for every image inside a zip archive.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Archive is not a valid zip")
+
+    with zf:
+        return [
+            (os.path.basename(name), zf.read(name))
+            for name in sorted(zf.namelist())
+            if name.lower().endswith(IMAGE_EXTS) and not name.endswith("/")
+        ]
+
+
+def roll_metadata(index, entry):
+    """
+    One entry of the batch "rolls" list, checked up front so a bad value
+    is a 400 rather than a failure halfway through the stream.
+    """
+    def bad(message):
+        raise HTTPException(status_code=400, detail=f"rolls[{index}]: {message}")
+
+    if not isinstance(entry, dict):
+        bad("must be an object")
+    if not isinstance(entry.get("filename") or "", str):
+        bad("filename must be a string")
+    for field in ("roll_no", *ROLL_META_FIELDS):
+        if isinstance(entry.get(field), (dict, list)):
+            bad(f"{field} must be a string")
+
+    quantity = entry.get("quantity")
+    if quantity is not None:
+        if isinstance(quantity, bool):
+            bad("quantity must be a number or null")
+        try:
+            quantity = float(quantity)
+        except (TypeError, ValueError):
+            bad("quantity must be a number or null")
+    return dict(entry, quantity=quantity)
+
+
+def match_roll_metadata(files, rolls_json):
+    """
+    Pairs each image with its roll metadata.
+
+    rolls_json: JSON list of {"roll_no", "quantity", "filename"?} plus
+    optional buyer / supplier / contract / lot / colourway.
+    Entries with a filename are matched by name, the rest by position.
+    Without metadata the roll number is the file name stem.
+    """
+    try:
+        meta = json.loads(rolls_json) if rolls_json else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="rolls is not valid JSON")
+    if not isinstance(meta, list):
+        raise HTTPException(status_code=400, detail="rolls must be a JSON list")
+    meta = [roll_metadata(i, m) for i, m in enumerate(meta)]
+
+    by_name = {m["filename"]: m for m in meta if m.get("filename")}
+    positional = [m for m in meta if not m.get("filename")]
+
+    items = []
+    for i, (filename, data) in enumerate(files):
+        m = by_name.get(filename)
+        if m is None and i < len(positional):
+            m = positional[i]
+        m = m or {}
+        items.append({
+            "roll_no": str(m.get("roll_no") or os.path.splitext(filename)[0]),
+            "quantity": m.get("quantity"),
+            "meta": {k: m.get(k) for k in ROLL_META_FIELDS},
+            "data": data,
+        })
+    return items
+
+
+def resolve_masters(ok, master_id, nearest):
+    """
+    resolve_master for each (item, stats); failures come back as the
+    HTTPException instead of a master.
+    """
+    masters = []
+    for item, stats in ok:
+        meta = item["meta"]
+        try:
+            masters.append(resolve_master(
+                stats[0], master_id, nearest, meta["buyer"], meta["contract"], meta["colourway"],
+            ))
+        except HTTPException as exc:
+            masters.append(exc)
+    return masters
+
+
+async def analyze_stream(items, master_id, nearest, background_tasks):
+    """
+    Analyses items on the executor and yields NDJSON lines as rolls finish.
+    Rolls that finished together share one batched ΔE call per master and
+    are stored before their lines are sent, so a client that disconnects
+    mid-stream loses nothing it was already shown.
+    """
+    import numpy as np
+    from color_engine import analyze_image, delta_e_2000_batch, tile_uniformity
+    from grouping import assign_shade_group
+    from data_store import add_rolls
+    from result_cache import get_cache
+
+    window = get_executor().max_workers
+    cache = get_cache()
+    queue = list(reversed(items))
+    in_flight = {}
+
+    while queue or in_flight:
+        ok = []
+
+        # Top up the window; back off if other requests filled the pool
+        while queue and len(in_flight) < window:
+            item = queue[-1]
+            if "key" not in item:
+                item["key"] = cache_key(item["data"])
+                cached = cache.get(item["key"])
+                if cached is not None:
+                    ok.append((queue.pop(), cached))
+                    continue
+            try:
+                task = get_executor().submit(analyze_image, item["data"])
+            except ExecutorSaturated:
+                break
+            in_flight[task] = queue.pop()
+
+        if ok:
+            done = {task for task in in_flight if task.done()}
+        elif in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(0.05)
+            continue
+
+        for task in done:
+            item = in_flight.pop(task)
+            exc = task.exception()
+            if exc is not None:
+                error = f"Analysis failed: {type(exc).__name__}"
+                yield json.dumps({"roll_no": item["roll_no"], "error": error}) + "\n"
+                continue
+            mean_lab, std_lab, _, tile_means = task.result()
+            if mean_lab is None:
+                yield json.dumps({"roll_no": item["roll_no"], "error": "Could not decode image"}) + "\n"
+                continue
+            cache.put(item["key"], mean_lab, std_lab, tile_means)
+            ok.append((item, (mean_lab, std_lab, tile_means)))
+
+        resolved = []
+        masters = await run_in_threadpool(resolve_masters, ok, master_id, nearest)
+        for (item, stats), master in zip(ok, masters):
+            if isinstance(master, HTTPException):
+                yield json.dumps({"roll_no": item["roll_no"], "error": master.detail}) + "\n"
+                continue
+            resolved.append((item, stats, master))
+
+        if not resolved:
+            continue
+
+        by_master = {}
+        for i, (_, _, master) in enumerate(resolved):
+            by_master.setdefault(master["id"], []).append(i)
+
+        delta_es = [None] * len(resolved)
+        for idx in by_master.values():
+            labs = np.array([np.asarray(resolved[i][1][0]) for i in idx], dtype=np.float64)
+            batch = delta_e_2000_batch(labs, resolved[idx[0]][2]["lab"]).tolist()
+            for i, de in zip(idx, batch):
+                delta_es[i] = de
+
+        rows, finished = [], []
+        for (item, (mean_lab, _, tile_means), master), delta_e in zip(resolved, delta_es):
+            shade, decision = assign_shade_group(delta_e)
+            path = schedule_archive(background_tasks, item["roll_no"], item["data"])
+            row = {
+                "roll_no": item["roll_no"],
+                "lab": [round(float(v), 2) for v in mean_lab],
+                "lab_stats": lab_stats_info(mean_lab),
+                "delta_e": round(delta_e, 2),
+                "shade_group": shade,
+                "decision": decision,
+                "quantity": item["quantity"],
+                "image": path,
+                "uniformity": None if tile_means is None else tile_uniformity(
+                    tile_means, mean_lab, master["lab"]
+                ),
+                "master": master_info(master),
+            }
+            rows.append(row)
+            finished.append(dict(row, lab=mean_lab, image_path=path, **item["meta"]))
+
+        with stage("persist"):
+            await run_in_threadpool(add_rolls, finished)
+        for row in rows:
+            yield json.dumps(row) + "\n"
+
+
+@router.post("/analyze-batch")
+async def analyze_batch(
+    background_tasks: BackgroundTasks,
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    rolls: Optional[str] = Form(None),
+    master_id: Optional[int] = Form(None),
+    nearest_master: bool = Form(False),
+):
+    """
+    Accepts many images (multipart "images" and/or a zip "archive") plus
+    optional roll metadata, and streams one NDJSON result per roll.
+    Masters are selected per roll as in /analyze.
+    """
+    from master_registry import get_registry
+
+    def check_masters():
+        registry = get_registry()
+        if not len(registry):
+            raise HTTPException(status_code=400, detail="Master shade not set")
+        if master_id is not None and registry.get_by_id(master_id) is None:
+            raise HTTPException(status_code=404, detail=f"No master with id {master_id}")
+
+    await run_in_threadpool(check_masters)
+
+    with stage("upload_read"):
+        files = [(f.filename, await f.read()) for f in images or []]
+        if archive is not None:
+            # Unpacking a large archive would stall every other request
+            files += await run_in_threadpool(read_zip_images, await archive.read())
+    if not files:
+        raise HTTPException(status_code=400, detail="No images supplied")
+
+    items = match_roll_metadata(files, rolls)
+
+    return StreamingResponse(
+        analyze_stream(items, master_id, nearest_master, background_tasks),
+        media_type="application/x-ndjson",
+    )
+
+
+# =================================================
+# DASHBOARD (pre-aggregated statistics, cursor-paged roll listing)
+# =================================================
+
+MAX_PAGE_SIZE = 500
+
+
+def stats_filters(buyer, supplier, date_from, date_to):
+    return dict(buyer=buyer, supplier=supplier, date_from=date_from, date_to=date_to)
+
+
+def read_rollups(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/stats/summary")
+def stats_summary(
+    buyer: Optional[str] = None,
+    supplier: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """
+    Totals for the dashboard cards: rolls, quantity, mean ΔE, decision and
+    shade group counts. Filter by one of buyer, supplier or a date range.
+    """
+    from data_store import rollup_stats
+
+    return read_rollups(rollup_stats, None, **stats_filters(buyer, supplier, date_from, date_to))[0]
+
+
+@router.get("/stats/breakdown")
+def stats_breakdown(
+    by: str = "shade_group",
+    buyer: Optional[str] = None,
+    supplier: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """
+    The same statistics per shade_group, decision, buyer, supplier or day.
+    """
+    from data_store import rollup_stats
+
+    return read_rollups(rollup_stats, by, **stats_filters(buyer, supplier, date_from, date_to))
+
+
+@router.get("/stats/delta-e")
+def stats_delta_e(
+    buyer: Optional[str] = None,
+    supplier: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """
+    ΔE00 distribution as fixed-width histogram bins.
+    """
+    from data_store import delta_e_distribution, DE_BIN_WIDTH
+
+    bins = read_rollups(delta_e_distribution, **stats_filters(buyer, supplier, date_from, date_to))
+    return {"bin_width": DE_BIN_WIDTH, "bins": bins}
+
+
+@router.get("/stats/lot-groups")
+def stats_lot_groups(lot: Optional[str] = None):
+    """
+    Rolls, quantity and mean ΔE per lot-level shade cluster (lot_group),
+    kept apart from the master ΔE bands in shade_group.
+    """
+    from data_store import lot_group_stats
+
+    return lot_group_stats(lot)
+
+
+def roll_info(roll):
+    return dict(roll, lab=[None if v != v else round(float(v), 2) for v in roll["lab"]])
+
+
+@router.get("/rolls")
+def list_rolls_page(
+    cursor: Optional[int] = None,
+    limit: int = 50,
+    order: str = "desc",
+    roll_no: Optional[str] = None,
+    lot: Optional[str] = None,
+    contract: Optional[str] = None,
+    buyer: Optional[str] = None,
+    supplier: Optional[str] = None,
+    shade_group: Optional[str] = None,
+    lot_group: Optional[str] = None,
+    decision: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """
+    One page of rolls (newest first by default). Pass next_cursor back as
+    cursor for the following page; it is null on the last page.
+    """
+    from data_store import list_rolls
+
+    if order not in ("desc", "asc"):
+        raise HTTPException(status_code=400, detail="order must be desc or asc")
+
+    rolls, next_cursor = list_rolls(
+        cursor=cursor, limit=max(1, min(limit, MAX_PAGE_SIZE)), descending=order == "desc",
+        roll_no=roll_no, lot=lot, contract=contract, buyer=buyer, supplier=supplier,
+        shade_group=shade_group, lot_group=lot_group, decision=decision,
+        date_from=date_from, date_to=date_to,
+    )
+    return {"rolls": [roll_info(r) for r in rolls], "next_cursor": next_cursor}
+
+
+# =================================================
+# REPORTS (paged out of the roll store, streamed to the client)
+# =================================================
+
+def iter_file(f, chunk_size=1 << 16):
+    with f:
+        f.seek(0)
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+@router.get("/report")
+async def download_report(
+    format: str = "xlsx",
+    buyer: Optional[str] = None,
+    contract: Optional[str] = None,
+    lot: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """
+    Roll-wise shade report as CSV (streamed row pages) or Excel (built in
+    constant-memory mode into a spooled temp file, then streamed).
+    """
+    from report import generate_excel_report, generate_csv_report
+
+    filters = dict(buyer=buyer, contract=contract, date_from=date_from, date_to=date_to, lot=lot)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M")
+
+    if format == "csv":
+        return StreamingResponse(
+            generate_csv_report(**filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="shade_report_{stamp}.csv"'},
+        )
+
+    if format != "xlsx":
+        raise HTTPException(status_code=400, detail="format must be xlsx or csv")
+
+    f = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+    await run_in_threadpool(generate_excel_report, f, **filters)
+
+    return StreamingResponse(
+        iter_file(f),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f'attachment; filename="shade_report_{stamp}.xlsx"'},
+    )
+
+
+# =================================================
+# LIVE CAMERA FEEDBACK (WebSocket)
+# =================================================
+
+@router.websocket("/ws/live")
+async def live_shade(
+    websocket: WebSocket,
+    master_id: Optional[int] = None,
+    nearest_master: bool = False,
+    buyer: Optional[str] = None,
+    contract: Optional[str] = None,
+    colourway: Optional[str] = None,
+):
+    """
+    Pushes shade group, ΔE and a stability flag for the live camera at
+    the monitor rate. Clients only receive; the server decides the pace.
+    """
+    from color_engine import delta_e_2000
+    from grouping import assign_shade_group
+    from live import get_monitor
+
+    await websocket.accept()
+    monitor = get_monitor()
+    readings = monitor.subscribe()
+
+    try:
+        while True:
+            reading = await readings.get()
+            if "error" in reading:
+                await websocket.send_json(reading)
+                break
+
+            mean_lab = reading["lab"]
+            try:
+                master = await run_in_threadpool(
+                    resolve_master, mean_lab, master_id, nearest_master, buyer, contract, colourway
+                )
+            except HTTPException as exc:
+                await websocket.send_json({"error": exc.detail})
+                continue
+
+            delta_e = delta_e_2000(mean_lab, master["lab"])
+            shade, decision = assign_shade_group(delta_e)
+
+            await websocket.send_json({
+                "lab": [round(float(v), 2) for v in mean_lab],
+                "delta_e": round(delta_e, 2),
+                "shade_group": shade,
+                "decision": decision,
+                "stability": reading["stability"],
+                "stable": reading["stable"],
+                "frame": reading["frame"],
+                "master": master_info(master),
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await monitor.unsubscribe(readings)
 
-    save_results([{
-        "roll_no": roll_no,
-        "L*": mean_lab[0],
-        "a*": mean_lab[1],
-        "b*": mean_lab[2],
-        "delta_e": round(delta_e,2),
-        "shade_group": shade,
-        "decision": decision
-    }])
 
-    return result[0]
+def __getattr__(name):
+    # `api.app` (and `uvicorn api:app`) still work: they resolve to the one
+    # application built in main.
+    if name == "app":
+        from main import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,72 @@
+"""
+Full vs fast ROI statistics: speed and accuracy.
+
+Renders textured fabric photos at several resolutions, runs the colour
+pipeline in both modes and reports the speed-up together with the ΔE00
+drift of the fast-mode mean against the full-mode mean.
+
+    python benchmarks/bench_fast_mode.py --sizes 12 24 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from color_engine import preprocess_roi, extract_lab_stats, delta_e_2000  # noqa: E402
+from synthetic import render_fabric, size_for, encode  # noqa: E402
+
+# Fabric base colours (CIE L*a*b*)
+SHADES = [(45.0, 35.0, 40.0), (50.0, 5.0, -35.0), (60.0, -30.0, 20.0), (85.0, 0.0, 3.0)]
+
+
+def fabric_image(megapixels, lab, seed=0):
+    return encode(render_fabric(lab, *size_for(megapixels), texture=6.0, noise=3.0, seed=seed))
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def run(sizes, repeat):
+    print(f"{'MP':>4} {'shade':>20} {'full ms':>9} {'fast ms':>9} {'speedup':>8} {'ΔE drift':>9}")
+    rows = []
+    for mp in sizes:
+        for i, lab in enumerate(SHADES):
+            data = fabric_image(mp, lab, seed=i)
+
+            t_full, (mean_full, _) = timed(
+                lambda: extract_lab_stats(preprocess_roi(data, fast=False)), repeat
+            )
+            t_fast, (mean_fast, _) = timed(
+                lambda: extract_lab_stats(preprocess_roi(data, fast=True)), repeat
+            )
+            drift = delta_e_2000(mean_full, mean_fast)
+
+            rows.append({
+                "megapixels": mp,
+                "shade_lab": lab,
+                "full_ms": round(t_full * 1000, 2),
+                "fast_ms": round(t_fast * 1000, 2),
+                "speedup": round(t_full / t_fast, 2),
+                "delta_e_drift": round(drift, 4),
+            })
+            print(f"{mp:>4} {str(lab):>20} {t_full*1000:9.1f} {t_fast*1000:9.1f} "
+                  f"{t_full/t_fast:7.1f}x {drift:9.4f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[2, 12, 24],
+                        help="image sizes in megapixels")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.sizes, args.repeat)
@@ -0,0 +1,49 @@
+"""
+Colour pipeline benchmarks (pytest-benchmark).
+
+    pip install pytest-benchmark
+    pytest benchmarks --benchmark-autosave                 # run all, save to .benchmarks/
+    pytest benchmarks -k "delta_e or grouping"             # subset
+    pytest benchmarks --benchmark-compare                  # against the last saved run
+    pytest benchmarks --benchmark-compare=0001 --benchmark-compare-fail=median:25%
+
+Saved runs carry the git commit (pytest-benchmark's machine/commit info),
+so results can be compared across commits.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Isolated store, no disk archiving, no result cache: measure real work.
+# Set before any app module is imported (they read settings on import).
+WORK_DIR = tempfile.mkdtemp(prefix="shade_qc_bench_")
+os.environ["SHADE_QC_DB"] = os.path.join(WORK_DIR, "bench.db")
+os.environ["SHADE_QC_ARCHIVE_UPLOADS"] = "0"
+os.environ["SHADE_QC_THUMBNAILS"] = "0"
+os.environ["SHADE_QC_CACHE_SIZE"] = "0"
+os.environ.pop("SHADE_QC_CACHE_PATH", None)
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def fabric_12mp():
+    import synthetic
+
+    return synthetic.encode(
+        synthetic.render_fabric(synthetic.DEFAULT_LAB, *synthetic.size_for(12))
+    )
+
+
+@pytest.fixture(scope="session")
+def lot_labs():
+    import numpy as np
+    import synthetic
+
+    rng = np.random.default_rng(1)
+    return np.asarray(synthetic.DEFAULT_LAB) + rng.normal(0, 1.5, (3000, 3))
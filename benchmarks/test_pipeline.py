@@ -0,0 +1,205 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import synthetic
+from color_engine import delta_e_2000, delta_e_2000_batch, extract_lab_stats, preprocess_roi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ---------- startup ----------
+
+HEAVY_MODULES = ("numpy", "cv2", "scipy", "xlsxwriter", "pandas", "PyQt5")
+
+IMPORT_PROBE = f"""
+import sys
+import main
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+
+def test_startup_import_main(benchmark):
+    """
+    Cold `import main` in a fresh interpreter (what a worker respawn pays
+    before it can accept connections).
+    """
+    def probe():
+        return subprocess.check_output(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=os.path.dirname(os.environ["SHADE_QC_DB"]),
+            text=True,
+            env=dict(os.environ, PYTHONPATH=ROOT),
+        ).strip()
+
+    heavy = benchmark.pedantic(probe, rounds=5, iterations=1)
+    benchmark.extra_info["heavy_modules_on_import"] = heavy.split(",") if heavy else []
+
+
+def test_startup_ready(benchmark):
+    """
+    Lifespan start -> /ready.
+    """
+    import main
+    from fastapi.testclient import TestClient
+
+    def until_ready():
+        with TestClient(main.create_app()) as client:
+            while client.get("/ready").status_code != 200:
+                time.sleep(0.002)
+
+    benchmark.pedantic(until_ready, rounds=3, iterations=1, warmup_rounds=1)
+
+
+# ---------- stages ----------
+
+@pytest.mark.parametrize("fast", [False, True], ids=["full", "fast"])
+def test_preprocess_roi_12mp(benchmark, fabric_12mp, fast):
+    benchmark(preprocess_roi, fabric_12mp, fast=fast)
+
+
+@pytest.mark.parametrize("robust", [False, True], ids=["mean_std", "robust"])
+def test_extract_lab_stats_12mp(benchmark, fabric_12mp, robust):
+    roi = preprocess_roi(fabric_12mp, fast=False)
+    benchmark(extract_lab_stats, roi, robust=robust)
+
+
+@pytest.fixture(scope="module")
+def random_labs():
+    rng = np.random.default_rng(0)
+    return rng.uniform([20, -40, -40], [90, 40, 40], (2000, 3))
+
+
+def test_delta_e_scalar_x2000(benchmark, random_labs):
+    master = random_labs[0]
+    benchmark(lambda: [delta_e_2000(lab, master) for lab in random_labs])
+
+
+@pytest.mark.parametrize("masters", [1, 20])
+def test_delta_e_batch_2000(benchmark, random_labs, masters):
+    benchmark(delta_e_2000_batch, random_labs, random_labs[:masters])
+
+
+# ---------- grouping ----------
+
+def test_grouping_against_master_3000(benchmark, lot_labs):
+    from grouping import group_rolls_against_master
+
+    rolls = [{"roll_no": str(i), "lab": lab} for i, lab in enumerate(lot_labs)]
+    benchmark(group_rolls_against_master, rolls, lot_labs[0])
+
+
+@pytest.mark.parametrize("n_rolls", [1000, 3000])
+def test_grouping_cluster(benchmark, lot_labs, n_rolls):
+    from grouping import LotGrouping
+
+    benchmark.pedantic(lambda: LotGrouping(1.5).fit(lot_labs[:n_rolls]), rounds=2, iterations=1)
+
+
+def test_grouping_add_300_to_2700(benchmark, lot_labs):
+    from grouping import LotGrouping
+
+    def fitted():
+        # add() mutates, so every round gets a freshly fitted lot
+        grouping = LotGrouping(1.5)
+        grouping.fit(lot_labs[:2700])
+        return (grouping, lot_labs[2700:]), {}
+
+    benchmark.pedantic(lambda grouping, labs: grouping.add(labs), setup=fitted, rounds=2)
+
+
+# ---------- endpoints ----------
+
+def test_analyze_endpoint(benchmark, requests=64, concurrency=8):
+    """
+    One round = `requests` uploads, `concurrency` at a time, through the
+    ASGI app. Throughput, latency percentiles and 503 retries go into
+    extra_info.
+    """
+    import httpx
+    import main
+
+    lot = synthetic.make_lot(requests + 1, megapixels=2, seed=7)
+    stats = {}
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/set-master", files={"image": ("m.jpg", lot[0]["image"])})
+
+            sem = asyncio.Semaphore(concurrency)
+            latencies = []
+            rejected = 0
+
+            async def one(roll):
+                nonlocal rejected
+                async with sem:
+                    t0 = time.perf_counter()
+                    while True:
+                        r = await client.post(
+                            "/analyze",
+                            data={"roll_no": roll["roll_no"], "quantity": "50"},
+                            files={"image": (f"{roll['roll_no']}.jpg", roll["image"])},
+                        )
+                        if r.status_code != 503:
+                            break
+                        # Backpressure: count it and retry shortly
+                        rejected += 1
+                        await asyncio.sleep(0.01)
+                    r.raise_for_status()
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one(r) for r in lot[1:]))
+            wall = time.perf_counter() - t0
+
+        latencies.sort()
+        stats.update(
+            requests=requests,
+            concurrency=concurrency,
+            throughput_rps=round(requests / wall, 2),
+            p50_ms=round(latencies[len(latencies) // 2], 2),
+            p95_ms=round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            rejected_503=rejected,
+        )
+
+    benchmark.pedantic(lambda: asyncio.run(run()), rounds=3, iterations=1)
+    benchmark.extra_info.update(stats)
+
+
+@pytest.fixture(scope="module")
+def filled_store(n_rolls=20000):
+    import data_store
+
+    rng = np.random.default_rng(3)
+    store = data_store.get_store()
+    store.clear()
+    store.add_rolls(
+        {"roll_no": f"R{i}", "buyer": "Bench", "contract": "C1",
+         "lab": rng.normal(50, 2, 3), "delta_e": float(rng.uniform(0, 6)),
+         "shade_group": "ABCDE"[i % 5], "decision": "ACCEPT", "quantity": 50.0}
+        for i in range(n_rolls)
+    )
+    return n_rolls
+
+
+def test_report_xlsx_20000(benchmark, filled_store):
+    import report
+
+    benchmark.pedantic(
+        lambda: report.generate_excel_report(io.BytesIO(), "Bench", "C1"), rounds=2, iterations=1
+    )
+
+
+def test_report_csv_20000(benchmark, filled_store):
+    import report
+
+    benchmark.pedantic(
+        lambda: sum(len(c) for c in report.generate_csv_report("Bench", "C1")),
+        rounds=3, iterations=1,
+    )
@@ -1,29 +1,211 @@
-import cv2
+import sys
+import threading
 import time
 
+import cv2
+import numpy as np
+
+# Force DirectShow on Windows (IMPORTANT), let OpenCV pick elsewhere
+DEFAULT_BACKEND = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+
+
+class FakeSource:
+    """
+    Synthetic capture source with the cv2.VideoCapture read() interface.
+    Produces a flat fabric colour plus sensor noise, paced at `fps`.
+    """
+
+    def __init__(self, width=1280, height=720, bgr=(60, 110, 170), noise=6.0, fps=30, seed=0):
+        self.width, self.height, self.fps = width, height, fps
+        self.bgr = np.asarray(bgr, dtype=np.float32)
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._open = True
+
+    def isOpened(self):
+        return self._open
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps,
+        }.get(prop, 0)
+
+    def read(self, image=None):
+        if not self._open:
+            return False, None
+
+        shape = (self.height, self.width, 3)
+        frame = self._rng.standard_normal(shape, dtype=np.float32)
+        frame *= self.noise
+        frame += self.bgr
+        np.clip(frame, 0, 255, out=frame)
+
+        if image is None or image.shape != shape:
+            image = np.empty(shape, dtype=np.uint8)
+        np.copyto(image, frame, casting="unsafe")
+        return True, image
+
+    def release(self):
+        self._open = False
+
 
 class Camera:
-    def __init__(self, camera_index=0):
-        # Force DirectShow (IMPORTANT for Windows)
-        self.cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+    """
+    Camera with a background grabber thread and a preallocated ring
+    buffer of the last `buffer_size` frames.
 
-        # Set resolution
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    source: camera index, video file path, or any object with the
+            cv2.VideoCapture read()/isOpened()/release() interface
+            (e.g. FakeSource).
+    """
 
-        # Warm-up delay (CRITICAL)
-        time.sleep(1)
+    def __init__(self, camera_index=0, backend=None, width=1280, height=720,
+                 buffer_size=8, fps=None, loop=True):
+        source = camera_index
+        self.loop = loop
+        self.is_file = isinstance(source, str)
 
-    def get_frame(self):
-        if not self.cap.isOpened():
-            return None
+        if isinstance(source, int):
+            self.cap = cv2.VideoCapture(source, DEFAULT_BACKEND if backend is None else backend)
+        elif isinstance(source, str):
+            self.cap = cv2.VideoCapture(source) if backend is None else cv2.VideoCapture(source, backend)
+        else:
+            self.cap = source
 
-        ret, frame = self.cap.read()
-        if not ret:
-            return None
+        # Set resolution (ignored by files / fake sources)
+        if isinstance(source, int):
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
 
-        return frame
+        # Files and fake sources are paced; live cameras block in read()
+        if fps is None and not isinstance(source, int):
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self._interval = 1.0 / fps if fps else 0.0
+
+        self.buffer_size = buffer_size
+        self._buffer = None          # (buffer_size, h, w, 3) uint8, allocated on first frame
+        self._acc = None             # float32 accumulator for averaging
+        self._count = 0              # frames written so far (never reset)
+        self._first = 0              # first frame held by the current buffer
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._running = True
+
+        self._thread = threading.Thread(target=self._grab_loop, name="camera-grabber", daemon=True)
+        self._thread.start()
+
+    # ---------- grabber thread ----------
+
+    def _grab_loop(self):
+        next_tick = time.perf_counter()
+        while not self._stop.is_set() and self.cap.isOpened():
+            slot = None
+            if self._buffer is not None:
+                slot = self._buffer[self._count % self.buffer_size]
+
+            ret, frame = self.cap.read(slot) if slot is not None else self.cap.read()
+            if not ret:
+                if self.is_file and self.loop:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+
+            with self._lock:
+                if self._buffer is None:
+                    self._buffer = np.empty((self.buffer_size, *frame.shape), dtype=np.uint8)
+                    slot = self._buffer[0]
+                if frame is not slot:
+                    # Backend returned its own array (or a new resolution)
+                    if frame.shape != self._buffer.shape[1:]:
+                        # frame_count keeps growing so readers still see new frames
+                        self._buffer = np.empty((self.buffer_size, *frame.shape), dtype=np.uint8)
+                        self._acc = None
+                        self._first = self._count
+                    self._buffer[self._count % self.buffer_size] = frame
+                self._count += 1
+                self._new_frame.notify_all()
+
+            if self._interval:
+                next_tick += self._interval
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    next_tick = time.perf_counter()
+
+        with self._lock:
+            self._running = False
+            self._new_frame.notify_all()
+
+    # ---------- readers ----------
+
+    @property
+    def frame_count(self):
+        """
+        Number of frames grabbed so far (use it to detect new frames).
+        """
+        return self._count
+
+    def wait_for_frame(self, after=0, timeout=2.0):
+        """
+        Blocks until more than `after` frames exist. Returns False on timeout.
+        """
+        with self._lock:
+            return self._new_frame.wait_for(
+                lambda: self._count > after or not self._running, timeout
+            ) and self._count > after
+
+    def latest_frame(self):
+        """
+        Most recent frame as a read-only view into the ring buffer (no
+        copy). It stays valid until buffer_size - 1 newer frames arrive.
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            view = self._buffer[(self._count - 1) % self.buffer_size].view()
+        view.flags.writeable = False
+        return view
+
+    def average_frames(self, n=4):
+        """
+        Temporal mean of the last n frames (n < buffer_size), rounded back
+        to uint8. Averages out sensor noise with no extra capture wait.
+        """
+        with self._lock:
+            # Only frames of the current size (slots before _first are stale)
+            n = min(n, self._count - self._first, self.buffer_size - 1)
+            if n <= 0:
+                return None
+            end = self._count
+            if self._acc is None:
+                self._acc = np.empty(self._buffer.shape[1:], dtype=np.float32)
+            acc = self._acc
+            acc.fill(0)
+            for i in range(end - n, end):
+                np.add(acc, self._buffer[i % self.buffer_size], out=acc)
+
+            acc *= 1.0 / n
+            return np.rint(acc, out=acc).astype(np.uint8)
+
+    def get_frame(self):
+        """
+        Latest frame as an owned copy (waits for the first frame).
+        """
+        if self._count == 0 and not self.wait_for_frame():
+            return None
+        frame = self.latest_frame()
+        return None if frame is None else frame.copy()
 
     def release(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2.0)
         if self.cap and self.cap.isOpened():
             self.cap.release()
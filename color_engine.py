@@ -1,120 +1,523 @@
+import os
+
 import cv2
 import numpy as np
-from math import sqrt, sin, cos, atan2, exp, radians
+
+from metrics import stage, timed
 
 # =================================================
 # PHASE 7: IMAGE PRE-PROCESSING
 # =================================================
 
-def preprocess_roi(image_path, roi=None):
+MEDIAN_KSIZE = 5
+
+# Fast mode: decode at reduced scale and area-resample the ROI before the
+# median blur. A stable mean needs far fewer pixels than a 24 MP photo.
+FAST_MODE = os.environ.get("SHADE_QC_FAST_MODE", "0") == "1"
+FAST_DECODE_REDUCE = int(os.environ.get("SHADE_QC_FAST_REDUCE", "4"))  # 1, 2, 4 or 8
+FAST_MAX_SIDE = int(os.environ.get("SHADE_QC_FAST_MAX_SIDE", "512"))
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def analysis_params(fast=None, robust=None):
     """
-    Loads image, applies basic cleaning and returns ROI.
-    ROI avoids folds, edges, selvedge.
+    Preprocessing settings that change the Lab result (used in cache keys).
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        return None
+    fast = FAST_MODE if fast is None else fast
+    robust = ROBUST_STATS if robust is None else robust
+    params = {"median_ksize": MEDIAN_KSIZE, "fast": fast}
+    if fast:
+        params.update(reduce=FAST_DECODE_REDUCE, max_side=FAST_MAX_SIDE)
+    if robust:
+        params.update(robust=True, l_band=ROBUST_L_BAND, l_max=ROBUST_L_MAX, trim=ROBUST_TRIM)
+    if TILE_MAP:
+        params.update(
+            tile_grid=TILE_GRID, tile_px=TILE_PX,
+            tile_margin=TILE_MARGIN, tile_oversample=TILE_OVERSAMPLE,
+        )
+    return params
+
+
+def load_image(source, reduce=1):
+    """
+    Returns a BGR image from a file path, encoded bytes or an ndarray.
+    Bytes are decoded in memory so uploads never touch the disk.
+
+    reduce: decode at 1/reduce scale (JPEG decodes this natively).
+    Ignored for ndarray input.
+    """
+    if isinstance(source, np.ndarray):
+        return source
 
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    flag = REDUCED_FLAGS[reduce]
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        buf = np.frombuffer(source, dtype=np.uint8)
+        if buf.size == 0:
+            return None
+        return cv2.imdecode(buf, flag)
+
+    return cv2.imread(str(source), flag)
+
+
+@timed("decode")
+def decode_image(image, fast=None):
+    """
+    Decodes image for analysis. Returns (bgr_img, reduce) where reduce is
+    the decode scale-down factor actually applied.
+    """
+    fast = FAST_MODE if fast is None else fast
+    reduce = FAST_DECODE_REDUCE if fast and not isinstance(image, np.ndarray) else 1
+    return load_image(image, reduce), reduce
+
+
+def roi_from_image(img, roi=None, fast=None, reduce=1):
+    """
+    Crops, cleans and returns the RGB ROI of an already decoded image.
+    """
+    fast = FAST_MODE if fast is None else fast
 
     # If ROI not provided, take center crop (safe default)
     h, w, _ = img.shape
     if roi is None:
         cx, cy = w // 4, h // 4
         roi = (cx, cy, w // 2, h // 2)
+    elif reduce > 1:
+        roi = tuple(v // reduce for v in roi)
 
     x, y, rw, rh = roi
-    roi_img = img[y:y+rh, x:x+rw]
+    with stage("roi_crop"):
+        roi_img = cv2.cvtColor(img[y:y+rh, x:x+rw], cv2.COLOR_BGR2RGB)
+
+        if fast:
+            rh, rw = roi_img.shape[:2]
+            scale = FAST_MAX_SIDE / max(rh, rw)
+            if scale < 1:
+                size = (max(1, round(rw * scale)), max(1, round(rh * scale)))
+                roi_img = cv2.resize(roi_img, size, interpolation=cv2.INTER_AREA)
 
     # Median filter to remove texture noise
-    roi_img = cv2.medianBlur(roi_img, 5)
+    with stage("median_blur"):
+        roi_img = cv2.medianBlur(roi_img, MEDIAN_KSIZE)
 
     return roi_img
 
 
+def preprocess_roi(image, roi=None, fast=None):
+    """
+    Loads image, applies basic cleaning and returns ROI.
+    ROI avoids folds, edges, selvedge.
+
+    image: file path, encoded image bytes or BGR ndarray
+    roi:   (x, y, w, h) in full-resolution pixels
+    fast:  reduced decode + area resample (defaults to FAST_MODE)
+    """
+    img, reduce = decode_image(image, fast)
+    if img is None:
+        return None
+
+    return roi_from_image(img, roi, fast, reduce)
+
+
 # =================================================
 # PHASE 8: RGB → L*a*b* (Mean + Std Deviation)
 # =================================================
 
-def extract_lab_stats(roi_img):
+def extract_lab_stats(roi_img, robust=None):
     """
     Converts ROI to L*a*b* and returns mean & std deviation.
+    In robust mode the mean is a LabStats (it behaves as its trimmed
+    mean) and the std is that of the pixels left after shadow /
+    highlight rejection.
     """
+    robust = ROBUST_STATS if robust is None else robust
     if roi_img is None:
         return None, None
 
-    lab = cv2.cvtColor(roi_img, cv2.COLOR_RGB2LAB)
-    pixels = lab.reshape(-1, 3).astype(np.float32)
+    with stage("lab_convert"):
+        lab = cv2.cvtColor(roi_img, cv2.COLOR_RGB2LAB)
+
+    if robust:
+        stats = histogram_lab_stats(lab)
+        return stats, stats.std.astype(np.float32)
 
-    mean_lab = pixels.mean(axis=0)
-    std_lab = pixels.std(axis=0)
+    # Single pass over the uint8 pixels, no float copy of the image
+    with stage("lab_stats"):
+        mean, std = cv2.meanStdDev(lab)
+    mean_lab = mean.ravel().astype(np.float32)
+    std_lab = std.ravel().astype(np.float32)
 
     return mean_lab, std_lab
 
 
+# =================================================
+# ROBUST LAB STATS (from 8-bit Lab histograms)
+# =================================================
+
+ROBUST_STATS = os.environ.get("SHADE_QC_ROBUST_STATS", "0") == "1"
+ROBUST_L_BAND = 20.0     # keep pixels within ±band L* of the median (shadows, slubs, specks)
+ROBUST_L_MAX = 97.0      # drop near-white specular highlights above this L*
+ROBUST_TRIM = 0.10       # trimmed mean drops this fraction of pixels at each tail
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class LabStats:
+    """
+    Compact robust Lab summary of a ROI, in the same OpenCV 8-bit Lab
+    units as extract_lab_stats.
+
+    It behaves as its trimmed mean (np.asarray, indexing, len), so a
+    LabStats can be handed straight to the ΔE and grouping functions in
+    place of a Lab vector.
+    """
+
+    __slots__ = ("mean", "std", "median", "trimmed_mean", "percentiles", "pixels", "rejected")
+
+    def __init__(self, mean, std, median, trimmed_mean, percentiles, pixels, rejected):
+        self.mean = mean                    # (3,) mean of the kept pixels
+        self.std = std                      # (3,) std of the kept pixels
+        self.median = median                # (3,)
+        self.trimmed_mean = trimmed_mean    # (3,)
+        self.percentiles = percentiles      # (len(PERCENTILES), 3)
+        self.pixels = pixels                # pixels kept
+        self.rejected = rejected            # pixels dropped as shadow / highlight
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.trimmed_mean, dtype=dtype)
+
+    def __getitem__(self, index):
+        return self.trimmed_mean[index]
+
+    def __len__(self):
+        return len(self.trimmed_mean)
+
+    @property
+    def rejected_fraction(self):
+        total = self.pixels + self.rejected
+        return self.rejected / total if total else 0.0
+
+    def to_dict(self):
+        def r(v):
+            return np.round(v, 2).tolist()
+        return {
+            "mean": r(self.mean),
+            "std": r(self.std),
+            "median": r(self.median),
+            "trimmed_mean": r(self.trimmed_mean),
+            "percentiles": dict(zip((f"p{p:02d}" for p in PERCENTILES), r(self.percentiles))),
+            "rejected_fraction": round(self.rejected_fraction, 4),
+        }
+
+    def state(self):
+        """
+        Full-precision fields as plain lists (for the result cache file).
+        """
+        return {
+            name: np.asarray(getattr(self, name)).tolist() if name not in ("pixels", "rejected")
+            else getattr(self, name)
+            for name in self.__slots__
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**{
+            name: np.asarray(value, dtype=np.float64) if name not in ("pixels", "rejected")
+            else int(value)
+            for name, value in state.items()
+        })
+
+
+def hist_percentiles(hist, fractions):
+    """
+    Percentiles of binned integer values (rows of hist), as np.percentile
+    gives on the values themselves: each bin is one value, interpolated
+    linearly between neighbouring order statistics only.
+    Returns (len(fractions), channels).
+    """
+    cdf = np.cumsum(hist, axis=1)
+    n = cdf[:, -1]
+    rank = np.outer(fractions, np.maximum(n - 1, 0))
+    below = np.floor(rank)
+    out = np.empty(rank.shape)
+    for c in range(hist.shape[0]):
+        # Value of the k-th smallest element: first bin whose cdf exceeds k
+        lo = np.searchsorted(cdf[c], below[:, c], side="right")
+        hi = np.searchsorted(cdf[c], np.minimum(below[:, c] + 1, max(n[c] - 1, 0)), side="right")
+        out[:, c] = lo + (rank[:, c] - below[:, c]) * (hi - lo)
+    return np.minimum(out, hist.shape[1] - 1)
+
+
+def hist_trimmed_mean(hist, trim):
+    """
+    Mean of each row's values after dropping `trim` of the mass at each end.
+    """
+    cdf = np.cumsum(hist, axis=1)
+    n = cdf[:, -1:]
+    kept = np.minimum(cdf, n * (1 - trim)) - np.maximum(cdf - hist, n * trim)
+    np.clip(kept, 0, None, out=kept)
+    return (kept @ np.arange(hist.shape[1])) / np.maximum(kept.sum(axis=1), 1e-12)
+
+
+@timed("lab_stats")
+def histogram_lab_stats(lab, band=ROBUST_L_BAND, l_max=ROBUST_L_MAX, trim=ROBUST_TRIM):
+    """
+    Robust stats of an 8-bit Lab image from two joint histograms
+    (L-a and L-b, 256x256 bins, one pass each). Rejecting pixels by L*
+    is then a row slice of those histograms, and the median, percentiles
+    and trimmed mean are read off the cumulative counts.
+    """
+    ranges = [0, 256, 0, 256]
+    la = cv2.calcHist([lab], [0, 1], None, [256, 256], ranges).astype(np.float64)
+    lb = cv2.calcHist([lab], [0, 2], None, [256, 256], ranges).astype(np.float64)
+    hist_l = la.sum(axis=1)
+    total = hist_l.sum()
+
+    # Shadows / slubs: far from the median L*; highlights: near-white L*
+    median_l = hist_percentiles(hist_l[None], [0.5])[0, 0]
+    # OpenCV 8-bit L = L* * 255 / 100
+    lo = max(0, int(np.ceil(median_l - band * 255 / 100)))
+    hi = min(int(l_max * 255 / 100), int(median_l + band * 255 / 100), 255)
+    if lo > hi or not hist_l[lo:hi + 1].any():
+        lo, hi = 0, 255   # nothing left (e.g. blown-out frame): keep everything
+
+    kept_l = np.zeros(256)
+    kept_l[lo:hi + 1] = hist_l[lo:hi + 1]
+    hist = np.stack([kept_l, la[lo:hi + 1].sum(axis=0), lb[lo:hi + 1].sum(axis=0)])
+    pixels = kept_l.sum()
+
+    values = np.arange(256)
+    mean = hist @ values / pixels
+    std = np.sqrt(np.maximum(hist @ (values ** 2) / pixels - mean ** 2, 0))
+    percentiles = hist_percentiles(hist, np.array(PERCENTILES) / 100)
+
+    return LabStats(
+        mean=mean,
+        std=std,
+        median=percentiles[PERCENTILES.index(50)],
+        trimmed_mean=hist_trimmed_mean(hist, trim),
+        percentiles=percentiles,
+        pixels=int(pixels),
+        rejected=int(total - pixels),
+    )
+
+
 # =================================================
 # PHASE 9: ΔE 2000 (Industry Standard)
 # =================================================
 
-def delta_e_2000(lab1, lab2):
+@timed("delta_e")
+def delta_e_2000_batch(lab1, lab2):
     """
-    Computes CIEDE2000 colour difference between two Lab values.
+    Vectorised CIEDE2000 between every pair of Lab rows.
+
+    lab1: (N, 3) or (3,) array
+    lab2: (M, 3) or (3,) array
+
+    Returns an (N, M) matrix. A 1-D input drops its axis, so
+    (N, 3) vs (3,) gives (N,) and (3,) vs (3,) gives a 0-d array.
     """
-    L1, a1, b1 = lab1.astype(float)
-    L2, a2, b2 = lab2.astype(float)
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+
+    # Broadcast to (N, 1) x (1, M)
+    L1, a1, b1 = [c[:, None] for c in np.atleast_2d(lab1).T]
+    L2, a2, b2 = [c[None, :] for c in np.atleast_2d(lab2).T]
 
-    avg_L = (L1 + L2) / 2
-    C1 = sqrt(a1**2 + b1**2)
-    C2 = sqrt(a2**2 + b2**2)
-    avg_C = (C1 + C2) / 2
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    avg_C7 = ((C1 + C2) / 2) ** 7
 
-    G = 0.5 * (1 - sqrt((avg_C**7) / (avg_C**7 + 25**7)))
+    G = 0.5 * (1 - np.sqrt(avg_C7 / (avg_C7 + 25.0**7)))
     a1p = (1 + G) * a1
     a2p = (1 + G) * a2
 
-    C1p = sqrt(a1p**2 + b1**2)
-    C2p = sqrt(a2p**2 + b2**2)
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    Cp_prod = C1p * C2p
+    achromatic = Cp_prod == 0
 
-    h1p = atan2(b1, a1p) % (2 * np.pi)
-    h2p = atan2(b2, a2p) % (2 * np.pi)
+    h1p = np.arctan2(b1, a1p)
+    h2p = np.arctan2(b2, a2p)
+    h1p[h1p < 0] += 2 * np.pi
+    h2p[h2p < 0] += 2 * np.pi
 
     dLp = L2 - L1
     dCp = C2p - C1p
 
+    # Hue difference, wrapped into [-pi, pi]
     dhp = h2p - h1p
-    if abs(dhp) > np.pi:
-        dhp -= 2 * np.pi * np.sign(dhp)
+    dhp = np.where(dhp > np.pi, dhp - 2 * np.pi, dhp)
+    dhp = np.where(dhp < -np.pi, dhp + 2 * np.pi, dhp)
+    dhp = np.where(achromatic, 0.0, dhp)
 
-    dHp = 2 * sqrt(C1p * C2p) * sin(dhp / 2)
+    dHp = 2 * np.sqrt(Cp_prod) * np.sin(dhp / 2)
 
     avg_Lp = (L1 + L2) / 2
     avg_Cp = (C1p + C2p) / 2
 
-    if abs(h1p - h2p) > np.pi:
-        avg_hp = (h1p + h2p + 2 * np.pi) / 2
-    else:
-        avg_hp = (h1p + h2p) / 2
+    # Mean hue: take the short way round the circle
+    h_sum = h1p + h2p
+    avg_hp = np.where(
+        np.abs(h1p - h2p) <= np.pi,
+        h_sum / 2,
+        np.where(h_sum < 2 * np.pi, (h_sum + 2 * np.pi) / 2, (h_sum - 2 * np.pi) / 2),
+    )
+    avg_hp = np.where(achromatic, h_sum, avg_hp)
 
+    # T from cos/sin of h only (multiple-angle identities, 2 trig calls not 4)
+    c1, s1 = np.cos(avg_hp), np.sin(avg_hp)
+    c2, s2 = 2 * c1 * c1 - 1, 2 * s1 * c1
+    c3, s3 = c1 * c2 - s1 * s2, s1 * c2 + c1 * s2
+    c4, s4 = 2 * c2 * c2 - 1, 2 * s2 * c2
     T = (
         1
-        - 0.17 * cos(avg_hp - radians(30))
-        + 0.24 * cos(2 * avg_hp)
-        + 0.32 * cos(3 * avg_hp + radians(6))
-        - 0.20 * cos(4 * avg_hp - radians(63))
+        - 0.17 * (c1 * np.cos(np.radians(30)) + s1 * np.sin(np.radians(30)))
+        + 0.24 * c2
+        + 0.32 * (c3 * np.cos(np.radians(6)) - s3 * np.sin(np.radians(6)))
+        - 0.20 * (c4 * np.cos(np.radians(63)) + s4 * np.sin(np.radians(63)))
     )
 
-    d_ro = 30 * exp(-((avg_hp - radians(275)) / radians(25)) ** 2)
-    R_C = sqrt((avg_Cp**7) / (avg_Cp**7 + 25**7))
-    S_L = 1 + (0.015 * (avg_Lp - 50) ** 2) / sqrt(20 + (avg_Lp - 50) ** 2)
+    d_ro = np.radians(30) * np.exp(-((np.degrees(avg_hp) - 275) / 25) ** 2)
+    avg_Cp7 = avg_Cp**7
+    R_C = 2 * np.sqrt(avg_Cp7 / (avg_Cp7 + 25.0**7))
+    S_L = 1 + (0.015 * (avg_Lp - 50) ** 2) / np.sqrt(20 + (avg_Lp - 50) ** 2)
     S_C = 1 + 0.045 * avg_Cp
     S_H = 1 + 0.015 * avg_Cp * T
-    R_T = -sin(2 * d_ro) * R_C
+    R_T = -np.sin(2 * d_ro) * R_C
 
-    dE = sqrt(
+    dE = np.sqrt(
         (dLp / S_L) ** 2 +
         (dCp / S_C) ** 2 +
         (dHp / S_H) ** 2 +
         R_T * (dCp / S_C) * (dHp / S_H)
     )
 
+    if lab2.ndim == 1:
+        dE = dE[:, 0]
+    if lab1.ndim == 1:
+        dE = dE[0]
+
     return dE
+
+
+def delta_e_2000(lab1, lab2):
+    """
+    Computes CIEDE2000 colour difference between two Lab values.
+    """
+    return float(delta_e_2000_batch(lab1, lab2))
+
+
+# =================================================
+# WITHIN-ROLL UNIFORMITY (tiled shade map)
+# =================================================
+
+TILE_MAP = os.environ.get("SHADE_QC_TILE_MAP", "1") == "1"
+TILE_GRID = (6, 8)    # rows, cols (cols run across the fabric width)
+TILE_PX = 16          # each tile is area-averaged down to TILE_PX² pixels
+TILE_MARGIN = 0.03    # trim frame edges, keep the selvedge-side tiles
+TILE_OVERSAMPLE = 4   # strided pre-sampling density per tile pixel
+
+
+@timed("tile_map")
+def tile_lab_means(img, grid=TILE_GRID, margin=TILE_MARGIN):
+    """
+    Mean Lab of every tile in a rows x cols grid over the whole frame.
+    Block reshape over a sampled, area-averaged copy, so cost barely
+    depends on image size and there are no per-tile Python loops.
+
+    img: decoded BGR image. Returns an (rows, cols, 3) float64 array.
+    """
+    gh, gw = grid
+    h, w = img.shape[:2]
+    my, mx = int(h * margin), int(w * margin)
+    frame = img[my:h - my, mx:w - mx]
+
+    # Point-sample large frames down first (strided), then area-average
+    sample = (gw * TILE_PX * TILE_OVERSAMPLE, gh * TILE_PX * TILE_OVERSAMPLE)
+    if frame.shape[1] > sample[0] and frame.shape[0] > sample[1]:
+        frame = cv2.resize(frame, sample, interpolation=cv2.INTER_NEAREST)
+    small = cv2.resize(frame, (gw * TILE_PX, gh * TILE_PX), interpolation=cv2.INTER_AREA)
+    small = cv2.medianBlur(small, MEDIAN_KSIZE)
+    lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB)
+
+    blocks = lab.reshape(gh, TILE_PX, gw, TILE_PX, 3)
+    return blocks.sum(axis=(1, 3), dtype=np.float64) / (TILE_PX * TILE_PX)
+
+
+def tile_uniformity(tile_means, roll_lab, master_lab=None):
+    """
+    Compact uniformity report from per-tile Lab means.
+
+    heatmap:            ΔE00 of each tile vs the roll mean
+    centre_to_selvedge: ΔE00 between centre and edge tile columns
+    side_to_side:       ΔE00 between left and right edge columns (listing)
+    master_*:           worst tile / spread vs master (when given)
+    """
+    gh, gw, _ = tile_means.shape
+    flat = tile_means.reshape(-1, 3)
+
+    de_roll = delta_e_2000_batch(flat, roll_lab)
+    worst = int(np.argmax(de_roll))
+
+    edge = max(1, gw // 4)
+    left = tile_means[:, :edge].reshape(-1, 3).mean(axis=0)
+    right = tile_means[:, -edge:].reshape(-1, 3).mean(axis=0)
+    centre = tile_means[:, edge:gw - edge].reshape(-1, 3).mean(axis=0)
+
+    report = {
+        "grid": [gh, gw],
+        "heatmap": np.round(de_roll.reshape(gh, gw), 2).tolist(),
+        "max_delta_e": round(float(de_roll[worst]), 2),
+        "mean_delta_e": round(float(de_roll.mean()), 2),
+        "worst_tile": [worst // gw, worst % gw],
+        "centre_to_selvedge": round(
+            float(delta_e_2000_batch(np.stack([left, right]), centre).max()), 2
+        ),
+        "side_to_side": round(delta_e_2000(left, right), 2),
+    }
+
+    if master_lab is not None:
+        de_master = delta_e_2000_batch(flat, master_lab)
+        worst_m = int(np.argmax(de_master))
+        report.update({
+            "master_max_delta_e": round(float(de_master[worst_m]), 2),
+            "master_worst_tile": [worst_m // gw, worst_m % gw],
+            "master_spread": round(float(de_master.max() - de_master.min()), 2),
+        })
+
+    return report
+
+
+# =================================================
+# FULL ROLL PIPELINE (runs inside the analysis executor)
+# =================================================
+
+def analyze_image(image, master_lab=None, roi=None, fast=None, tiles=None, robust=None):
+    """
+    ROI -> Lab stats -> ΔE against master in one call.
+    Kept at module level so a process pool can pickle it.
+
+    Returns (mean_lab, std_lab, delta_e, tile_means); delta_e is None
+    without a master, tile_means is None when the tile map is off.
+    In robust mode mean_lab is the full LabStats.
+    """
+    img, reduce = decode_image(image, fast)
+    if img is None:
+        return None, None, None, None
+
+    mean_lab, std_lab = extract_lab_stats(roi_from_image(img, roi, fast, reduce), robust)
+
+    tile_means = None
+    if TILE_MAP if tiles is None else tiles:
+        tile_means = tile_lab_means(img)
+
+    delta_e = None
+    if master_lab is not None:
+        delta_e = delta_e_2000(mean_lab, master_lab)
+
+    return mean_lab, std_lab, delta_e, tile_means
@@ -1,24 +1,866 @@
-from grouping import assign_shade_group
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
 
-# ----------- GLOBAL STORAGE -----------
-ROLL_DATA = []
+import numpy as np
 
-def add_roll(roll_no, image_path, lab):
-    ROLL_DATA.append({
-        "roll_no": roll_no,
-        "image_path": image_path,
-        "lab": lab,
-        "shade_group": "-",
-        "delta_e": None
-    })
+from metrics import stage
+
+# ----------- PERSISTENT STORAGE (SQLite, WAL) -----------
+DB_PATH = os.environ.get("SHADE_QC_DB", "shade_qc.db")
+POOL_SIZE = int(os.environ.get("SHADE_QC_DB_POOL", "4"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rolls (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    roll_no     TEXT NOT NULL,
+    lot         TEXT,
+    contract    TEXT,
+    buyer       TEXT,
+    supplier    TEXT,
+    date        TEXT,
+    image_path  TEXT,
+    L           REAL,
+    a           REAL,
+    b           REAL,
+    delta_e     REAL,
+    shade_group TEXT DEFAULT '-',
+    decision    TEXT,
+    quantity    REAL,
+    created_at  TEXT,
+    lot_group   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_rolls_roll_no ON rolls(roll_no);
+CREATE INDEX IF NOT EXISTS idx_rolls_contract_lot ON rolls(contract, lot);
+CREATE INDEX IF NOT EXISTS idx_rolls_lot ON rolls(lot);
+CREATE INDEX IF NOT EXISTS idx_rolls_buyer ON rolls(buyer);
+CREATE INDEX IF NOT EXISTS idx_rolls_date ON rolls(date);
+CREATE INDEX IF NOT EXISTS idx_rolls_shade_group ON rolls(shade_group);
+"""
+
+COLUMNS = (
+    "roll_no", "lot", "contract", "buyer", "supplier", "date", "image_path",
+    "L", "a", "b", "delta_e", "shade_group", "decision", "quantity", "created_at",
+    "lot_group",
+)
+
+# ----------- DASHBOARD ROLLUPS (kept up to date on every write) -----------
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roll_rollups (
+    dim         TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    shade_group TEXT NOT NULL,
+    decision    TEXT NOT NULL,
+    rolls       INTEGER NOT NULL DEFAULT 0,
+    quantity    REAL NOT NULL DEFAULT 0,
+    de_sum      REAL NOT NULL DEFAULT 0,
+    de_n        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dim, key, shade_group, decision)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS roll_delta_e_bins (
+    dim         TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    bin         INTEGER NOT NULL,
+    rolls       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dim, key, bin)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lot_group_rollups (
+    lot         TEXT NOT NULL,
+    lot_group   TEXT NOT NULL,
+    rolls       INTEGER NOT NULL DEFAULT 0,
+    quantity    REAL NOT NULL DEFAULT 0,
+    de_sum      REAL NOT NULL DEFAULT 0,
+    de_n        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (lot, lot_group)
+) WITHOUT ROWID;
+"""
+
+# Rollup dimension -> rolls column ("all" = every roll). Each dimension is
+# further split by shade group and decision, so one dimension plus those
+# two can be answered straight from the rollup table.
+# shade_group is the ΔE band against the master (A-E / REJECT); lot-level
+# clusters from perform_grouping live in lot_group and lot_group_rollups.
+ROLLUP_DIMS = {"all": None, "buyer": "buyer", "supplier": "supplier", "day": "date"}
+BREAKDOWNS = ("shade_group", "decision", "buyer", "supplier", "day")
+DE_BIN_WIDTH = 0.5
+DE_BIN_COUNT = 24     # the last bin is open-ended (ΔE >= 11.5)
+
+ROLLUP_UPSERT = """
+INSERT INTO roll_rollups (dim, key, shade_group, decision, rolls, quantity, de_sum, de_n)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dim, key, shade_group, decision) DO UPDATE SET
+    rolls = rolls + excluded.rolls,
+    quantity = quantity + excluded.quantity,
+    de_sum = de_sum + excluded.de_sum,
+    de_n = de_n + excluded.de_n
+"""
+BINS_UPSERT = """
+INSERT INTO roll_delta_e_bins (dim, key, bin, rolls) VALUES (?, ?, ?, ?)
+ON CONFLICT (dim, key, bin) DO UPDATE SET rolls = rolls + excluded.rolls
+"""
+LOT_GROUP_UPSERT = """
+INSERT INTO lot_group_rollups (lot, lot_group, rolls, quantity, de_sum, de_n)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (lot, lot_group) DO UPDATE SET
+    rolls = rolls + excluded.rolls,
+    quantity = quantity + excluded.quantity,
+    de_sum = de_sum + excluded.de_sum,
+    de_n = de_n + excluded.de_n
+"""
+
+
+def delta_e_bin(delta_e):
+    return min(int(delta_e / DE_BIN_WIDTH), DE_BIN_COUNT - 1)
+
+
+def rollup_increments(rolls, sign=1, groups=None, bins=None):
+    """
+    Adds the rollup contributions of rolls (mappings with the rolls
+    table columns) into groups / bins dicts, times sign.
+    """
+    groups = {} if groups is None else groups
+    bins = {} if bins is None else bins
+    for r in rolls:
+        delta_e, quantity = r["delta_e"], r["quantity"]
+        group, decision = r["shade_group"] or "", r["decision"] or ""
+        for dim, column in ROLLUP_DIMS.items():
+            key = (r[column] or "") if column else ""
+            g = groups.setdefault((dim, key, group, decision), [0, 0.0, 0.0, 0])
+            g[0] += sign
+            g[1] += sign * (quantity or 0.0)
+            if delta_e is not None:
+                g[2] += sign * delta_e
+                g[3] += sign
+                b = (dim, key, delta_e_bin(delta_e))
+                bins[b] = bins.get(b, 0) + sign
+    return groups, bins
+
+
+def lot_group_increments(rolls, sign=1, groups=None):
+    """
+    lot_group_rollups contributions of clustered rolls, times sign.
+    """
+    groups = {} if groups is None else groups
+    for r in rolls:
+        if r["lot_group"] is None:
+            continue
+        g = groups.setdefault((r["lot"] or "", r["lot_group"]), [0, 0.0, 0.0, 0])
+        g[0] += sign
+        g[1] += sign * (r["quantity"] or 0.0)
+        if r["delta_e"] is not None:
+            g[2] += sign * r["delta_e"]
+            g[3] += sign
+    return groups
+
+
+def write_lot_group_rollups(conn, groups):
+    conn.executemany(LOT_GROUP_UPSERT, [k + tuple(v) for k, v in groups.items() if any(v)])
+    if any(v[0] < 0 for v in groups.values()):
+        conn.execute("DELETE FROM lot_group_rollups WHERE rolls <= 0")
+
+
+def write_rollups(conn, groups, bins):
+    conn.executemany(ROLLUP_UPSERT, [k + tuple(v) for k, v in groups.items() if any(v)])
+    conn.executemany(BINS_UPSERT, [k + (v,) for k, v in bins.items() if v])
+    if any(v[0] < 0 for v in groups.values()):
+        conn.execute("DELETE FROM roll_rollups WHERE rolls <= 0")
+    if any(v < 0 for v in bins.values()):
+        conn.execute("DELETE FROM roll_delta_e_bins WHERE rolls <= 0")
+
+
+FILTERS = {
+    "roll_no": "roll_no = ?",
+    "lot": "lot = ?",
+    "contract": "contract = ?",
+    "buyer": "buyer = ?",
+    "supplier": "supplier = ?",
+    "shade_group": "shade_group = ?",
+    "lot_group": "lot_group = ?",
+    "decision": "decision = ?",
+    "date_from": "date >= ?",
+    "date_to": "date <= ?",
+}
+
+
+# ----------- SHARED STATE VERSIONS (several worker processes, one database) -----------
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state_versions (
+    name        TEXT PRIMARY KEY,
+    version     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lot_groups (
+    roll_id     INTEGER PRIMARY KEY,
+    lot         TEXT,
+    tolerance   REAL NOT NULL,
+    group_index INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lot_groups_lot ON lot_groups(lot);
+"""
+
+
+def bump_version(conn, name):
+    """
+    Marks shared state `name` as changed. Call inside the writing transaction.
+    """
+    conn.execute(
+        "INSERT INTO state_versions (name, version) VALUES (?, 1) "
+        "ON CONFLICT (name) DO UPDATE SET version = version + 1",
+        (name,),
+    )
+
+
+def read_version(conn, name):
+    row = conn.execute("SELECT version FROM state_versions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def lot_version_name(lot):
+    """
+    state_versions name of a lot's grouping. Named lots get "=" before the
+    name so rolls without a lot ("null") never share a counter with one.
+    """
+    return "lot_groups/null" if lot is None else f"lot_groups/={lot}"
+
+
+class VersionWatch:
+    """
+    Cheap "did shared state change?" check for in-process caches.
+
+    PRAGMA data_version on a private connection only moves when another
+    connection (any thread or process) commits, so the usual answer costs
+    one pragma and no table read.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript(STATE_SCHEMA)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._versions = {}
+
+    def current(self, name):
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._versions = dict(
+                    self._conn.execute("SELECT name, version FROM state_versions")
+                )
+            return self._versions.get(name, 0)
+
+    def close(self):
+        self._conn.close()
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared across threads.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._free = queue.Queue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._size = size
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._created < self._size
+                if grow:
+                    self._created += 1
+            conn = self._connect() if grow else self._free.get()
+        try:
+            yield conn
+        finally:
+            self._free.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._free.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+class RollStore:
+    """
+    Indexed roll table. Rows come back as dicts shaped like the old
+    in-memory ROLL_DATA entries ("lab" is an np.array).
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(rolls)")}
+            if "lot_group" not in columns:   # database from before lot groups had a column
+                conn.execute("ALTER TABLE rolls ADD COLUMN lot_group TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rolls_lot_group ON rolls(lot, lot_group)")
+            conn.executescript(ROLLUP_SCHEMA)
+            conn.executescript(STATE_SCHEMA)
+            missing = (
+                conn.execute("SELECT EXISTS (SELECT 1 FROM rolls)").fetchone()[0]
+                and not conn.execute("SELECT EXISTS (SELECT 1 FROM roll_rollups)").fetchone()[0]
+            )
+        if missing:   # database from before the rollups existed
+            self.rebuild_rollups()
+
+    # ---------- writes ----------
+
+    @contextmanager
+    def write_transaction(self):
+        """
+        Connection holding the database write lock (BEGIN IMMEDIATE) for
+        the whole block, so read-compute-write sequences are atomic across
+        worker processes. Commits on success, rolls back on error.
+        """
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @staticmethod
+    def _to_row(roll):
+        lab = roll.get("lab")
+        if lab is None:
+            lab = (roll.get("L*"), roll.get("a*"), roll.get("b*"))
+        L, a, b = (None if v is None else float(v) for v in lab)
+
+        delta_e = roll.get("delta_e")
+        quantity = roll.get("quantity")
+        return (
+            str(roll["roll_no"]),
+            roll.get("lot"),
+            roll.get("contract"),
+            roll.get("buyer"),
+            roll.get("supplier"),
+            roll.get("date") or date.today().isoformat(),
+            roll.get("image_path") or roll.get("image"),
+            L, a, b,
+            None if delta_e is None else float(delta_e),
+            roll.get("shade_group") or "-",
+            roll.get("decision"),
+            None if quantity is None else float(quantity),
+            datetime.now().isoformat(timespec="seconds"),
+            roll.get("lot_group"),
+        )
+
+    def add_rolls(self, rolls):
+        """
+        Inserts many rolls in one transaction, together with their
+        dashboard rollup increments.
+        """
+        rows = [self._to_row(r) for r in rolls]
+        if not rows:
+            return 0
+
+        sql = (
+            f"INSERT INTO rolls ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})"
+        )
+        groups, bins = rollup_increments(dict(zip(COLUMNS, row)) for row in rows)
+        lot_groups = lot_group_increments(dict(zip(COLUMNS, row)) for row in rows)
+        with stage("db_insert"), self.pool.connection() as conn, conn:
+            conn.executemany(sql, rows)
+            write_rollups(conn, groups, bins)
+            write_lot_group_rollups(conn, lot_groups)
+        return len(rows)
+
+    @staticmethod
+    def _select_ids(conn, ids):
+        ids = list(ids)
+        rows = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows += conn.execute(
+                f"SELECT * FROM rolls WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+        return rows
+
+    @classmethod
+    def _move_lot_groups(cls, conn, new_group):
+        """
+        Sets lot groups (row id -> lot group) and their rollups on conn.
+        """
+        old = cls._select_ids(conn, new_group)
+        groups = lot_group_increments(old, sign=-1)
+        moved = [dict(r, lot_group=new_group[r["id"]]) for r in old]
+        lot_group_increments(moved, groups=groups)
+
+        conn.executemany(
+            "UPDATE rolls SET lot_group = ? WHERE id = ?",
+            [(group, row_id) for row_id, group in new_group.items()],
+        )
+        write_lot_group_rollups(conn, groups)
+
+    def clear(self):
+        with self.pool.connection() as conn, conn:
+            conn.execute("DELETE FROM rolls")
+            conn.execute("DELETE FROM roll_rollups")
+            conn.execute("DELETE FROM roll_delta_e_bins")
+            conn.execute("DELETE FROM lot_group_rollups")
+            conn.execute("DELETE FROM lot_groups")
+            # Other workers must drop their cached lot groupings
+            conn.execute(
+                "UPDATE state_versions SET version = version + 1 WHERE name LIKE 'lot_groups/%'"
+            )
+
+    def rebuild_rollups(self):
+        """
+        Recomputes the rollup tables from the roll table (upgrades / repair).
+        """
+        with self.pool.connection() as conn, conn:
+            conn.execute("DELETE FROM roll_rollups")
+            conn.execute("DELETE FROM roll_delta_e_bins")
+            conn.execute("DELETE FROM lot_group_rollups")
+            conn.execute(
+                "INSERT INTO lot_group_rollups "
+                "SELECT COALESCE(lot, ''), lot_group, COUNT(*), COALESCE(SUM(quantity), 0), "
+                "COALESCE(SUM(delta_e), 0), COUNT(delta_e) FROM rolls "
+                "WHERE lot_group IS NOT NULL GROUP BY 1, 2"
+            )
+            for dim, column in ROLLUP_DIMS.items():
+                key = f"COALESCE({column}, '')" if column else "''"
+                conn.execute(
+                    f"INSERT INTO roll_rollups "
+                    f"SELECT ?, {key}, COALESCE(shade_group, ''), COALESCE(decision, ''), "
+                    f"COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(delta_e), 0), "
+                    f"COUNT(delta_e) FROM rolls GROUP BY 2, 3, 4",
+                    (dim,),
+                )
+                conn.execute(
+                    f"INSERT INTO roll_delta_e_bins "
+                    f"SELECT ?, {key}, MIN(CAST(delta_e / ? AS INTEGER), ?), COUNT(*) "
+                    f"FROM rolls WHERE delta_e IS NOT NULL GROUP BY 2, 3",
+                    (dim, DE_BIN_WIDTH, DE_BIN_COUNT - 1),
+                )
+
+    # ---------- reads ----------
+
+    @staticmethod
+    def _to_dict(row):
+        d = dict(row)
+        d["lab"] = np.array([d.pop("L"), d.pop("a"), d.pop("b")], dtype=np.float64)
+        return d
+
+    @staticmethod
+    def _where(filters):
+        clauses, params = [], []
+        for key, value in filters.items():
+            if value is None:
+                continue
+            if key not in FILTERS:
+                raise ValueError(f"Unknown roll filter: {key}")
+            clauses.append(FILTERS[key])
+            params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query_rolls(self, limit=None, offset=0, **filters):
+        """
+        Filtered rolls in insertion order. Filters: roll_no, lot, contract,
+        buyer, supplier, shade_group, decision, date_from, date_to.
+        """
+        where, params = self._where(filters)
+        sql = f"SELECT * FROM rolls{where} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+
+        with stage("db_query"), self.pool.connection() as conn:
+            return [self._to_dict(r) for r in conn.execute(sql, params)]
+
+    def iter_rolls(self, page_size=1000, **filters):
+        """
+        Yields filtered rolls page by page (keyset on id), so callers
+        never hold the whole table in memory.
+        """
+        where, params = self._where(filters)
+        sql = (
+            f"SELECT * FROM rolls{where}{' AND' if where else ' WHERE'} id > ? "
+            "ORDER BY id LIMIT ?"
+        )
+        last_id = 0
+        while True:
+            with stage("db_page"), self.pool.connection() as conn:
+                page = conn.execute(sql, params + [last_id, page_size]).fetchall()
+            if not page:
+                return
+            for row in page:
+                yield self._to_dict(row)
+            last_id = page[-1]["id"]
+
+    def list_rolls(self, cursor=None, limit=50, descending=True, **filters):
+        """
+        One page of filtered rolls for listings. cursor is the next_cursor
+        of the previous page (a roll id). Returns (rolls, next_cursor);
+        next_cursor is None on the last page.
+        """
+        where, params = self._where(filters)
+        if cursor is not None:
+            where += f"{' AND' if where else ' WHERE'} id {'<' if descending else '>'} ?"
+            params.append(int(cursor))
+        sql = (
+            f"SELECT * FROM rolls{where} ORDER BY id {'DESC' if descending else 'ASC'} LIMIT ?"
+        )
+        with stage("db_page"), self.pool.connection() as conn:
+            page = conn.execute(sql, params + [int(limit) + 1]).fetchall()
+
+        next_cursor = page[limit - 1]["id"] if len(page) > limit else None
+        return [self._to_dict(r) for r in page[:limit]], next_cursor
+
+    # ---------- dashboard rollups ----------
+
+    @staticmethod
+    def _rollup_scope(by, buyer, supplier, date_from, date_to):
+        """
+        Picks the rollup dimension that answers the query. Rollups hold one
+        dimension at a time, so only filters on that dimension are allowed.
+        """
+        if by is not None and by not in BREAKDOWNS:
+            raise ValueError(f"Unknown breakdown: {by}")
+
+        scope = [d for d, v in (("buyer", buyer), ("supplier", supplier)) if v is not None]
+        if date_from is not None or date_to is not None:
+            scope.append("day")
+        if len(scope) > 1 or (by in ROLLUP_DIMS and scope and scope != [by]):
+            raise ValueError(
+                "Statistics can be filtered by one of buyer, supplier or date, "
+                "and only by the dimension they are broken down by"
+            )
+
+        dim = by if by in ROLLUP_DIMS else (scope[0] if scope else "all")
+        clauses, params = ["dim = ?"], [dim]
+        if dim in ("buyer", "supplier") and scope:
+            clauses.append("key = ?")
+            params.append(buyer if dim == "buyer" else supplier)
+        if date_from is not None:
+            clauses.append("key >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            clauses.append("key <= ?")
+            params.append(date_to)
+        return " AND ".join(clauses), params
+
+    def rollup_stats(self, by=None, buyer=None, supplier=None, date_from=None, date_to=None):
+        """
+        Roll counts, quantity, mean ΔE and decision / shade group counts,
+        read from the rollup tables (cost does not grow with roll count).
+
+        by: None (one overall entry) or one of BREAKDOWNS.
+        """
+        where, params = self._rollup_scope(by, buyer, supplier, date_from, date_to)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT key, shade_group, decision, rolls, quantity, de_sum, de_n "
+                f"FROM roll_rollups WHERE {where}",
+                params,
+            ).fetchall()
+
+        def new_entry(key):
+            return {"key": key or None, "rolls": 0, "quantity": 0.0,
+                    "de_sum": 0.0, "de_n": 0, "decisions": {}, "shade_groups": {}}
+
+        field = {"shade_group": 1, "decision": 2}.get(by, 0 if by else None)
+        # The overall summary always has its one entry, even with no rolls
+        entries = {} if by else {"": new_entry("")}
+        for row in rows:
+            key = row[field] if field is not None else ""
+            e = entries.get(key)
+            if e is None:
+                e = entries[key] = new_entry(key)
+            e["rolls"] += row["rolls"]
+            e["quantity"] += row["quantity"]
+            e["de_sum"] += row["de_sum"]
+            e["de_n"] += row["de_n"]
+            decision, group = row["decision"] or None, row["shade_group"] or None
+            e["decisions"][decision] = e["decisions"].get(decision, 0) + row["rolls"]
+            e["shade_groups"][group] = e["shade_groups"].get(group, 0) + row["rolls"]
+
+        result = []
+        for key in sorted(entries):
+            e = entries[key]
+            de_sum, de_n = e.pop("de_sum"), e.pop("de_n")
+            e["quantity"] = round(e["quantity"], 3)
+            e["avg_delta_e"] = round(de_sum / de_n, 3) if de_n else None
+            accepted = e["decisions"].get("ACCEPT", 0)
+            e["acceptance_rate"] = round(accepted / e["rolls"], 4) if e["rolls"] else None
+            result.append(e)
+        return result
+
+    def delta_e_distribution(self, buyer=None, supplier=None, date_from=None, date_to=None):
+        """
+        ΔE00 histogram (DE_BIN_WIDTH wide bins, the last one open-ended).
+        """
+        where, params = self._rollup_scope(None, buyer, supplier, date_from, date_to)
+        counts = [0] * DE_BIN_COUNT
+        with self.pool.connection() as conn:
+            for row in conn.execute(
+                f"SELECT bin, SUM(rolls) FROM roll_delta_e_bins WHERE {where} GROUP BY bin",
+                params,
+            ):
+                counts[row[0]] = row[1]
+
+        return [
+            {
+                "from": i * DE_BIN_WIDTH,
+                "to": None if i == DE_BIN_COUNT - 1 else (i + 1) * DE_BIN_WIDTH,
+                "rolls": n,
+            }
+            for i, n in enumerate(counts)
+        ]
+
+    def lot_group_stats(self, lot=None):
+        """
+        Rolls, quantity and mean ΔE per lot group (from perform_grouping),
+        for one lot or all lots. Rolls not clustered yet are not counted.
+        """
+        sql = "SELECT lot, lot_group, rolls, quantity, de_sum, de_n FROM lot_group_rollups"
+        params = []
+        if lot is not None:
+            sql += " WHERE lot = ?"
+            params.append(lot)
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql + " ORDER BY lot, length(lot_group), lot_group", params).fetchall()
+
+        return [
+            {
+                "lot": row["lot"] or None,
+                "lot_group": row["lot_group"],
+                "rolls": row["rolls"],
+                "quantity": round(row["quantity"], 3),
+                "avg_delta_e": round(row["de_sum"] / row["de_n"], 3) if row["de_n"] else None,
+            }
+            for row in rows
+        ]
+
+    def count_rolls(self, **filters):
+        where, params = self._where(filters)
+        with stage("db_count"), self.pool.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM rolls{where}", params).fetchone()[0]
+
+
+_STORE = None
+
+
+def get_store():
+    global _STORE
+    if _STORE is None:
+        _STORE = RollStore()
+    return _STORE
+
+
+# ----------- MODULE API (kept compatible) -----------
+
+def add_roll(roll_no, image_path, lab, **meta):
+    get_store().add_rolls([dict(meta, roll_no=roll_no, image_path=image_path, lab=lab)])
+
+def add_rolls(rolls):
+    """
+    Bulk insert of already analysed rolls (one write per batch).
+    """
+    return get_store().add_rolls(rolls)
 
 def get_all_rolls():
-    return ROLL_DATA
+    return get_store().query_rolls()
+
+def query_rolls(limit=None, offset=0, **filters):
+    return get_store().query_rolls(limit=limit, offset=offset, **filters)
+
+def iter_rolls(page_size=1000, **filters):
+    return get_store().iter_rolls(page_size=page_size, **filters)
+
+def list_rolls(cursor=None, limit=50, descending=True, **filters):
+    return get_store().list_rolls(cursor=cursor, limit=limit, descending=descending, **filters)
+
+def rollup_stats(by=None, **filters):
+    return get_store().rollup_stats(by=by, **filters)
+
+def delta_e_distribution(**filters):
+    return get_store().delta_e_distribution(**filters)
+
+def lot_group_stats(lot=None):
+    return get_store().lot_group_stats(lot=lot)
+
+# Per-lot clustering state, so new rolls are grouped incrementally.
+# Only a cache: the assignments live in lot_groups, and an entry is used
+# only while its version matches, so every worker continues from the
+# latest grouping whichever worker made it.
+_LOT_GROUPINGS = {}
+
+# Optimistic passes (cluster without the write lock) before perform_grouping
+# clusters under the lock instead
+GROUPING_ATTEMPTS = 3
+
+def _read_lots(conn, store, tolerance, lot):
+    """
+    Snapshot for perform_grouping: the rolls and, per lot, its version,
+    the cached grouping if still current, else the saved lot_groups rows.
+    """
+    where, params = store._where({"lot": lot})
+    with stage("db_query"):
+        rolls = [
+            store._to_dict(r)
+            for r in conn.execute(f"SELECT * FROM rolls{where} ORDER BY id", params)
+        ]
+
+    lots = {}
+    for roll in rolls:
+        lots.setdefault(roll["lot"], {"rolls": []})["rolls"].append(roll)
+
+    for lot_key, snap in lots.items():
+        snap["version"] = read_version(conn, lot_version_name(lot_key))
+        snap["by_id"] = {r["id"]: r for r in snap["rolls"]}
+
+        # Taken out while it is extended: it goes back only once the new
+        # assignments are committed
+        state = _LOT_GROUPINGS.pop(lot_key, None)
+        if (state is None or state["version"] != snap["version"]
+                or state["tolerance"] != tolerance or not state["ids"] <= snap["by_id"].keys()):
+            state = None
+            snap["saved"] = conn.execute(
+                "SELECT roll_id, tolerance, group_index FROM lot_groups "
+                "WHERE lot IS ? ORDER BY roll_id",
+                (lot_key,),
+            ).fetchall()
+        snap["state"] = state
+
+    return rolls, lots
+
+def _saved_lot_grouping(rows, tolerance, rolls_by_id):
+    """
+    Rebuilds a lot's grouping from its lot_groups rows as (grouping, roll
+    ids), or None when there is nothing usable (no rows, other tolerance,
+    grouped rolls deleted).
+    """
+    from grouping import LotGrouping
+
+    if not rows or any(
+        r["tolerance"] != tolerance or r["roll_id"] not in rolls_by_id for r in rows
+    ):
+        return None
+
+    labs = [rolls_by_id[r["roll_id"]]["lab"] for r in rows]
+    grouping = LotGrouping.restore(labs, [r["group_index"] for r in rows], tolerance)
+    return grouping, {r["roll_id"] for r in rows}
+
+def _cluster_lots(lots, tolerance):
+    """
+    Places each lot's ungrouped rolls. Needs no database access, so it
+    runs without holding any lock.
+    """
+    from grouping import cluster_rolls   # pulls in OpenCV; only needed here
+
+    plans = {}
+    for lot_key, snap in lots.items():
+        state, reset = snap["state"], False
+        if state is None:
+            saved = _saved_lot_grouping(snap["saved"], tolerance, snap["by_id"])
+            if saved is None:
+                # Start over: the old assignments no longer apply
+                saved, reset = (None, set()), True
+            state = {"tolerance": tolerance, "grouping": saved[0],
+                     "ids": saved[1], "version": snap["version"]}
+
+        new = [r for r in snap["rolls"] if r["id"] not in state["ids"]]
+        if new:
+            _, grouping = cluster_rolls(new, tolerance, state["grouping"])
+            state = {
+                "tolerance": tolerance, "grouping": grouping, "version": snap["version"],
+                "ids": state["ids"] | {r["id"] for r in new},
+            }
+        plans[lot_key] = {"state": state, "new": new, "reset": reset}
+    return plans
+
+def _write_lot_groups(conn, store, plans, tolerance):
+    """
+    Writes planned assignments on conn, which must hold the write lock.
+    Returns False, writing nothing, when another worker has regrouped one
+    of the lots since it was read.
+    """
+    pending = {k: p for k, p in plans.items() if p["new"]}
+    for lot_key, plan in pending.items():
+        if read_version(conn, lot_version_name(lot_key)) != plan["state"]["version"]:
+            return False
+
+    changed = {}
+    for lot_key, plan in pending.items():
+        new, grouping = plan["new"], plan["state"]["grouping"]
+        if plan["reset"]:
+            conn.execute("DELETE FROM lot_groups WHERE lot IS ?", (lot_key,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO lot_groups (roll_id, lot, tolerance, group_index) "
+            "VALUES (?, ?, ?, ?)",
+            [(r["id"], lot_key, tolerance, int(g))
+             for r, g in zip(new, grouping.labels[-len(new):])],
+        )
+        bump_version(conn, lot_version_name(lot_key))
+        plan["state"]["version"] += 1
+        changed.update((r["id"], r["lot_group"]) for r in new)
+
+    if changed:
+        with stage("db_update"):
+            store._move_lot_groups(conn, changed)
+    return True
+
+def perform_grouping(tolerance=1.5, lot=None):
+    """
+    Lot-level shade clustering: inside each lot every pair of rolls in a
+    group is within `tolerance` ΔE00. Rolls already grouped keep their
+    group; only rolls added since the last call are placed. Groups go to
+    lot_group; shade_group keeps the ΔE band against the master.
+
+    Clustering runs on a snapshot without the write lock; the lock is
+    taken only to check that no other worker regrouped the lots meanwhile
+    and to write the result. A pass that lost that race is redone, and
+    after GROUPING_ATTEMPTS the whole pass runs under the lock, so each
+    roll is placed exactly once, against the same groups.
+    """
+    store = get_store()
+
+    for _ in range(GROUPING_ATTEMPTS):
+        with store.pool.connection() as conn:
+            conn.execute("BEGIN")   # one consistent snapshot, no lock on writers
+            try:
+                rolls, lots = _read_lots(conn, store, tolerance, lot)
+            finally:
+                conn.rollback()
+
+        plans = _cluster_lots(lots, tolerance)
+        with store.write_transaction() as conn:
+            written = _write_lot_groups(conn, store, plans, tolerance)
+        if written:
+            break
+    else:
+        with store.write_transaction() as conn:
+            rolls, lots = _read_lots(conn, store, tolerance, lot)
+            plans = _cluster_lots(lots, tolerance)
+            _write_lot_groups(conn, store, plans, tolerance)
 
-def perform_grouping(tolerance=1.5):
-    global ROLL_DATA
-    ROLL_DATA = assign_shade_group(ROLL_DATA, tolerance)
-    return ROLL_DATA
+    # Cache only what was committed
+    _LOT_GROUPINGS.update((k, p["state"]) for k, p in plans.items())
+    return rolls
 
-def save_results():
-    return ROLL_DATA
+def save_results(results):
+    add_rolls(results)
+    return results
@@ -1,4 +1,7 @@
-from color_engine import delta_e_2000
+import numpy as np
+
+from color_engine import delta_e_2000_batch
+from metrics import timed
 
 # =================================================
 # PHASE 10: SHADE GROUPING LOGIC (Industry Friendly)
@@ -28,6 +31,7 @@ def assign_shade_group(delta_e):
         return "REJECT", "REJECT"
 
 
+@timed("group_against_master")
 def group_rolls_against_master(rolls, master_lab):
     """
     Groups fabric rolls by comparing each roll with master shade
@@ -44,9 +48,14 @@ def group_rolls_against_master(rolls, master_lab):
     """
 
     results = []
+    if not rolls:
+        return results
+
+    # One vectorised pass instead of a ΔE call per roll
+    labs = np.array([roll["lab"] for roll in rolls], dtype=np.float64)
+    delta_es = delta_e_2000_batch(labs, master_lab)
 
-    for roll in rolls:
-        de = delta_e_2000(roll["lab"], master_lab)
+    for roll, de in zip(rolls, delta_es.tolist()):
         shade, decision = assign_shade_group(de)
 
         roll_result = {
@@ -62,3 +71,202 @@ def group_rolls_against_master(rolls, master_lab):
         results.append(roll_result)
 
     return results
+
+
+# =================================================
+# LOT-LEVEL SHADE CLUSTERING (pairwise ΔE tolerance)
+# =================================================
+
+PAIRWISE_BLOCK = 512   # rows per ΔE block, bounds temporary memory
+
+
+@timed("pairwise_delta_e")
+def pairwise_delta_e(labs_a, labs_b=None):
+    """
+    ΔE00 matrix between two sets of Lab rows (float32), computed in
+    row blocks so a few thousand rolls never need gigabytes of temporaries.
+    With one set only the upper triangle is computed and mirrored.
+    """
+    labs_a = np.asarray(labs_a, dtype=np.float64).reshape(-1, 3)
+
+    if labs_b is None:
+        n = len(labs_a)
+        out = np.empty((n, n), dtype=np.float32)
+        for start in range(0, n, PAIRWISE_BLOCK):
+            stop = start + PAIRWISE_BLOCK
+            block = delta_e_2000_batch(labs_a[start:stop], labs_a[start:])
+            out[start:stop, start:] = block
+            out[start:, start:stop] = block.T
+        return out
+
+    labs_b = np.asarray(labs_b, dtype=np.float64).reshape(-1, 3)
+    out = np.empty((len(labs_a), len(labs_b)), dtype=np.float32)
+    for start in range(0, len(labs_a), PAIRWISE_BLOCK):
+        stop = start + PAIRWISE_BLOCK
+        out[start:stop] = delta_e_2000_batch(labs_a[start:stop], labs_b)
+    return out
+
+
+def group_label(index):
+    """
+    0 -> "A", 25 -> "Z", 26 -> "AA", ...
+    """
+    label = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        label = chr(ord("A") + rem) + label
+    return label
+
+
+class LotGrouping:
+    """
+    Groups the rolls of one lot so that every pair inside a group is
+    within `tolerance` ΔE00 (complete-linkage criterion).
+
+    Groups are grown greedily from the darkest unassigned roll, always
+    adding the candidate whose worst ΔE to the group is smallest. Each
+    step is one vectorised update of a max-distance vector, so a lot of
+    n rolls costs O(n²) on a precomputed ΔE matrix.
+
+    add() places new rolls into existing groups where the pairwise limit
+    still holds and opens new groups otherwise; existing assignments
+    never move.
+    """
+
+    def __init__(self, tolerance=1.5):
+        self.tolerance = tolerance
+        self.labs = np.empty((0, 3), dtype=np.float64)
+        self.dist = np.empty((0, 0), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.int64)
+        self.n_groups = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def restore(cls, labs, labels, tolerance=1.5):
+        """
+        Rebuilds a grouping from saved assignments (e.g. written by another
+        worker) so add() can continue from it.
+        """
+        grouping = cls(tolerance)
+        grouping.labs = np.asarray(labs, dtype=np.float64).reshape(-1, 3)
+        grouping.dist = pairwise_delta_e(grouping.labs)
+        grouping.labels = np.asarray(labels, dtype=np.int64)
+        grouping.n_groups = int(grouping.labels.max()) + 1 if len(grouping.labels) else 0
+        return grouping
+
+    @timed("cluster_fit")
+    def fit(self, labs):
+        """
+        Clusters a whole lot from scratch. Returns the group index per roll.
+        """
+        self.labs = np.asarray(labs, dtype=np.float64).reshape(-1, 3)
+        self.dist = pairwise_delta_e(self.labs)
+        self.labels = np.full(len(self.labs), -1, dtype=np.int64)
+        self.n_groups = 0
+
+        self._grow_groups(np.arange(len(self.labs)))
+        return self.labels
+
+    @timed("cluster_add")
+    def add(self, labs):
+        """
+        Adds rolls to an existing lot. Returns the group index of each new roll.
+        """
+        new = np.asarray(labs, dtype=np.float64).reshape(-1, 3)
+        if len(new) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        n_old = len(self.labs)
+        cross = pairwise_delta_e(new, self.labs)
+        inner = pairwise_delta_e(new)
+
+        dist = np.empty((n_old + len(new),) * 2, dtype=np.float32)
+        dist[:n_old, :n_old] = self.dist
+        dist[n_old:, :n_old] = cross
+        dist[:n_old, n_old:] = cross.T
+        dist[n_old:, n_old:] = inner
+
+        self.dist = dist
+        self.labs = np.vstack([self.labs, new])
+        self.labels = np.concatenate([self.labels, np.full(len(new), -1, dtype=np.int64)])
+
+        # Worst ΔE from each new roll to each existing group
+        if self.n_groups:
+            worst = np.zeros((len(new), self.n_groups), dtype=np.float32)
+            np.maximum.at(worst.T, self.labels[:n_old], cross.T)
+        else:
+            worst = np.zeros((len(new), 0), dtype=np.float32)
+
+        leftovers = []
+        for i in self._seed_order(np.arange(n_old, n_old + len(new))):
+            row = worst[i - n_old]
+            fits = np.flatnonzero(row <= self.tolerance)
+            if len(fits) == 0:
+                leftovers.append(i)
+                continue
+
+            group = fits[np.argmin(row[fits])]
+            self.labels[i] = group
+            # Later new rolls must also respect this one
+            pending = np.arange(n_old, n_old + len(new))
+            worst[:, group] = np.maximum(worst[:, group], self.dist[pending, i])
+
+        self._grow_groups(np.array(leftovers, dtype=np.int64))
+        return self.labels[n_old:]
+
+    def _seed_order(self, idx):
+        # Darkest first, then a*, b* so results are deterministic
+        labs = self.labs[idx]
+        return idx[np.lexsort((labs[:, 2], labs[:, 1], labs[:, 0]))]
+
+    def _grow_groups(self, idx):
+        unassigned = np.zeros(len(self.labs), dtype=bool)
+        unassigned[idx] = True
+
+        for seed in self._seed_order(idx):
+            if not unassigned[seed]:
+                continue
+
+            group = self.n_groups
+            self.n_groups += 1
+            self.labels[seed] = group
+            unassigned[seed] = False
+
+            # Worst ΔE from every roll to the current members
+            max_d = self.dist[seed].copy()
+            while True:
+                candidates = np.flatnonzero(unassigned & (max_d <= self.tolerance))
+                if len(candidates) == 0:
+                    break
+                pick = candidates[np.argmin(max_d[candidates])]
+                self.labels[pick] = group
+                unassigned[pick] = False
+                np.maximum(max_d, self.dist[pick], out=max_d)
+
+    def group_names(self):
+        return [group_label(g) for g in self.labels]
+
+
+def cluster_rolls(rolls, tolerance=1.5, grouping=None):
+    """
+    Assigns lot-level shade groups to rolls (list of dicts with "lab").
+    They go to "lot_group"; "shade_group" stays the band against the master.
+
+    Pass an existing LotGrouping to add rolls to it incrementally;
+    otherwise the rolls are clustered from scratch.
+
+    Returns (rolls with "lot_group" set, LotGrouping).
+    """
+    if grouping is None:
+        grouping = LotGrouping(tolerance)
+        labels = grouping.fit([r["lab"] for r in rolls]) if rolls else []
+    else:
+        labels = grouping.add([r["lab"] for r in rolls])
+
+    for roll, g in zip(rolls, labels):
+        roll["lot_group"] = group_label(int(g))
+
+    return rolls, grouping
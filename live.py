@@ -0,0 +1,178 @@
+import asyncio
+import os
+from collections import deque
+
+import numpy as np
+
+from camera import Camera, FakeSource
+from color_engine import analyze_image, delta_e_2000_batch
+from workers import get_executor, ExecutorSaturated
+
+# =================================================
+# LIVE SHADE MONITOR (camera -> Lab at a fixed rate)
+# =================================================
+
+# "0", "1", ... camera index; "fake" synthetic source; anything else a video file
+CAMERA_SOURCE = os.environ.get("SHADE_QC_CAMERA", "0")
+LIVE_HZ = float(os.environ.get("SHADE_QC_LIVE_HZ", "4"))
+LIVE_AVERAGE_FRAMES = 4       # temporal average per reading
+STABILITY_WINDOW = 6          # readings considered for the stability flag
+STABILITY_DELTA_E = 0.5       # max ΔE00 spread to call the reading stable
+
+
+def open_camera(source=CAMERA_SOURCE):
+    if source == "fake":
+        return Camera(FakeSource())
+    if source.isdigit():
+        return Camera(int(source))
+    return Camera(source)
+
+
+def measure_frame(frame):
+    if frame is None:
+        return None
+    mean_lab, _, _, _ = analyze_image(frame, None, None, True, False)
+    return mean_lab
+
+
+def measure_frames(camera, n=LIVE_AVERAGE_FRAMES):
+    """
+    Averages the camera's last n frames and measures Lab, as one job on
+    the analysis executor (the averaging is too slow for the event loop).
+    """
+    return measure_frame(camera.average_frames(n))
+
+
+class LiveMonitor:
+    """
+    One measuring loop per camera, shared by every live client.
+
+    At LIVE_HZ it takes the averaged latest frames (older frames are never
+    queued, so they are simply dropped), measures Lab on the analysis
+    executor and publishes the reading. At most one measurement is in
+    flight, so CPU use is bounded by the rate, not by client count or
+    camera frame rate. The camera is opened for the first subscriber and
+    released after the last one leaves.
+    """
+
+    def __init__(self, source=CAMERA_SOURCE, hz=LIVE_HZ):
+        self.source = source
+        self.interval = 1.0 / hz
+        self.camera = None
+        self.history = deque(maxlen=STABILITY_WINDOW)
+        self._subscribers = set()
+        self._task = None
+
+    # ---------- subscribers ----------
+
+    def subscribe(self):
+        """
+        Returns a queue that always holds only the newest reading.
+        """
+        q = asyncio.Queue(maxsize=1)
+        self._subscribers.add(q)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return q
+
+    async def unsubscribe(self, q):
+        self._subscribers.discard(q)
+        task = self._task
+        if self._subscribers or task is None:
+            return
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        # A client may have subscribed while the loop was shutting down
+        # (e.g. a page reload); it saw the old task and started none
+        if self._task is task:
+            self._task = None
+            if self._subscribers:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _publish(self, reading):
+        for q in self._subscribers:
+            if q.full():
+                q.get_nowait()   # drop the stale reading
+            q.put_nowait(reading)
+
+    # ---------- measuring loop ----------
+
+    def stability(self):
+        """
+        Max ΔE00 of the recent readings from their mean (lower = steadier).
+        """
+        if len(self.history) < 2:
+            return None
+        labs = np.array(self.history)
+        return float(delta_e_2000_batch(labs, labs.mean(axis=0)).max())
+
+    async def _run(self):
+        try:
+            await self._measure_loop()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Clients wait on their queue: tell them instead of going quiet
+            self._publish({"error": f"Live monitor stopped: {type(exc).__name__}: {exc}"})
+
+    async def _measure_loop(self):
+        loop = asyncio.get_running_loop()
+        self.camera = await loop.run_in_executor(None, open_camera, self.source)
+        self.history.clear()
+        last_seen = 0
+        try:
+            if not await loop.run_in_executor(None, self.camera.wait_for_frame):
+                self._publish({"error": "Camera unavailable"})
+                return
+
+            while True:
+                started = loop.time()
+
+                count = self.camera.frame_count
+                if count > last_seen:
+                    last_seen = count
+                    executor = get_executor()
+                    try:
+                        if executor.kind == "thread":
+                            mean_lab = await executor.run(measure_frames, self.camera)
+                        else:
+                            # The camera cannot go to another process: average
+                            # on a local thread, measure on the pool
+                            frame = await loop.run_in_executor(
+                                None, self.camera.average_frames, LIVE_AVERAGE_FRAMES
+                            )
+                            mean_lab = await executor.run(measure_frame, frame)
+                    except ExecutorSaturated:
+                        mean_lab = None   # uploads have priority, skip this tick
+
+                    if mean_lab is not None:
+                        self.history.append(np.asarray(mean_lab, dtype=np.float64))
+                        spread = self.stability()
+                        self._publish({
+                            "lab": mean_lab,
+                            "frame": count,
+                            "stability": None if spread is None else round(spread, 2),
+                            "stable": spread is not None
+                                      and len(self.history) == STABILITY_WINDOW
+                                      and spread <= STABILITY_DELTA_E,
+                        })
+
+                await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+        finally:
+            camera, self.camera = self.camera, None
+            await loop.run_in_executor(None, camera.release)
+
+
+_MONITOR = None
+
+
+def get_monitor():
+    global _MONITOR
+    if _MONITOR is None:
+        _MONITOR = LiveMonitor()
+    return _MONITOR
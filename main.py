@@ -1,25 +1,151 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+import api
+from metrics import MetricsMiddleware
+from workers import get_executor, shutdown_executor
+
+# =================================================
+# APP FACTORY (single entry point: uvicorn main:app)
+# =================================================
+
+# Run one tiny analysis at startup so OpenCV, its thread pool and the
+# analysis executor are warm before the first real upload
+WARMUP = os.environ.get("SHADE_QC_WARMUP", "1") != "0"
+
+
+def _timed_step(steps, name, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    steps[name] = round((time.perf_counter() - t0) * 1000, 1)
+    return result
+
+
+def _open_stores(steps):
+    """
+    Opens the roll store, master registry and Lab stats cache
+    (imports numpy / OpenCV on the way).
+    """
+    from data_store import get_store
+    from master_registry import get_registry
+    from result_cache import get_cache
+
+    _timed_step(steps, "store", get_store)
+    _timed_step(steps, "registry", get_registry)
+    _timed_step(steps, "cache", get_cache)
+
+
+async def _initialise(app, warmup):
+    """
+    Background startup: the server accepts connections straight away and
+    /ready turns 200 once this is done. Requests that arrive earlier still
+    work, they just pay for the imports themselves.
+    """
+    state = app.state
+    steps = state.startup
+    try:
+        await asyncio.to_thread(_open_stores, steps)
+
+        if warmup:
+            import numpy as np
+            from color_engine import analyze_image
+
+            sample = np.full((64, 96, 3), 128, dtype=np.uint8)
+            t0 = time.perf_counter()
+            await get_executor().run(analyze_image, sample)
+            steps["warmup"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        steps["total"] = round((time.perf_counter() - state.started) * 1000, 1)
+        state.ready = True
+    except Exception as exc:
+        state.startup_error = f"{type(exc).__name__}: {exc}"
+
+
+def create_app(warmup=None):
+    """
+    Builds the Shade QC application: all routes from api, CORS and metrics
+    middleware, and a lifespan that initialises storage in the background
+    and shuts the analysis executor down cleanly.
+    """
+    warmup = WARMUP if warmup is None else warmup
+
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.ready = False
+        app.state.startup = {}
+        app.state.startup_error = None
+        app.state.started = time.perf_counter()
+        # Uploads (and the thumbnails made from them) are only written
+        # when archiving is on; the thumbnail cache makes its own folders
+        if api.ARCHIVE_UPLOADS:
+            os.makedirs(api.UPLOAD_DIR, exist_ok=True)
+
+        init = asyncio.get_running_loop().create_task(_initialise(app, warmup))
+        try:
+            yield
+        finally:
+            init.cancel()
+            try:
+                await init
+            except asyncio.CancelledError:
+                pass
+            shutdown_executor()
+            # Only touch the cache if this process ever loaded it
+            if "result_cache" in sys.modules:
+                sys.modules["result_cache"].get_cache().save()
+
+    app = FastAPI(
+        title="Fabric Shade Matching and Grouping",
+        description="Backend API for fabric shade analysis and grouping",
+        version="1.0",
+        lifespan=lifespan,
+    )
+
+    # Allow frontend (React / UI) to talk to backend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # later we can restrict this
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/")
+    def root():
+        return {"status": "Shade QC backend running"}
+
+    @app.get("/health")
+    def health_check():
+        """
+        Liveness: the process is up and serving. pid tells workers apart.
+        """
+        return {"status": "OK", "pid": os.getpid()}
+
+    @app.get("/ready")
+    def readiness_check():
+        """
+        Readiness: storage is open (and OpenCV warmed up, if enabled).
+        """
+        state = app.state
+        if getattr(state, "ready", False):
+            return {"status": "ready", "startup_ms": state.startup}
+        error = getattr(state, "startup_error", None)
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed" if error else "starting", "error": error,
+                     "startup_ms": getattr(state, "startup", {})},
+        )
+
+    app.include_router(api.router)
+    return app
+
 
-app = FastAPI(
-    title="Fabric Shade Matching and Grouping",
-    description="Backend API for fabric shade analysis and grouping",
-    version="1.0"
-)
-
-# Allow frontend (React / UI) to talk to backend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # later we can restrict this
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/")
-def root():
-    return {"status": "Backend running successfully"}
-
-@app.get("/health")
-def health_check():
-    return {"status": "OK"}
+app = create_app()
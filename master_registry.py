@@ -0,0 +1,243 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from color_engine import delta_e_2000_batch
+from data_store import (
+    ConnectionPool, DB_PATH, POOL_SIZE, STATE_SCHEMA, VersionWatch, bump_version, read_version,
+)
+
+# =================================================
+# MASTER SHADE REGISTRY (buyer / contract / colourway)
+# =================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS masters (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    buyer       TEXT NOT NULL DEFAULT '',
+    contract    TEXT NOT NULL DEFAULT '',
+    colourway   TEXT NOT NULL DEFAULT '',
+    L           REAL NOT NULL,
+    a           REAL NOT NULL,
+    b           REAL NOT NULL,
+    image_path  TEXT,
+    updated_at  TEXT,
+    UNIQUE (buyer, contract, colourway)
+);
+"""
+
+# Euclidean (ΔE76) candidates re-ranked with exact ΔE00
+NEAREST_CANDIDATES = 16
+# Lower bound of 1 + R_T·xy / (x² + y²) in CIEDE2000: |R_T| < 2·sin(60°)
+_ROTATION_FLOOR = 1 - np.sin(np.radians(60))
+
+
+def kd_tree(points):
+    """
+    cKDTree over the points, or None without scipy (brute-force prefilter).
+    scipy is imported here, on first use, to keep startup fast.
+    """
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    return cKDTree(points)
+
+
+def chroma_weight_bound(max_chroma, max_l_offset):
+    """
+    Upper bound of the CIEDE2000 weights S_L, S_C, S_H for any pair of
+    colours with chroma <= max_chroma and |L - 50| <= max_l_offset.
+    """
+    # a' = (1 + G) a with G <= 0.5, so C' <= 1.5 C; T <= 1.93 keeps S_H <= S_C
+    s_c = 1 + 0.045 * 1.5 * max_chroma
+    s_l = 1 + 0.015 * max_l_offset ** 2 / np.sqrt(20 + max_l_offset ** 2)
+    return max(s_c, s_l)
+
+
+def delta_e76_radius(delta_e, weight_bound):
+    """
+    ΔE76 radius that contains every colour within ΔE00 `delta_e`.
+
+    ΔE00² >= _ROTATION_FLOOR · ((ΔL'/S_L)² + (ΔC'/S_C)² + (ΔH'/S_H)²), and
+    ΔC'² + ΔH'² = Δa'² + Δb'² >= Δa² + Δb², so
+    ΔE76 <= ΔE00 · max(S) / sqrt(_ROTATION_FLOOR).
+    """
+    return delta_e * weight_bound / np.sqrt(_ROTATION_FLOOR)
+
+
+def master_key(buyer=None, contract=None, colourway=None):
+    """
+    Normalised registry key. The all-empty key is the default master.
+    """
+    return (buyer or "", contract or "", colourway or "")
+
+
+class MasterRegistry:
+    """
+    Persistent master shades with a Lab-space spatial index.
+
+    Lookups never touch the masters table: all masters are held in memory
+    (a few hundred Lab triples) and the KD-tree is rebuilt on change.
+
+    Every write bumps the "masters" state version in the same transaction.
+    Lookups compare it with the version they loaded (normally a single
+    PRAGMA, see VersionWatch), so a master set through one worker process
+    is used by all of them from their next lookup.
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.executescript(STATE_SCHEMA)
+
+        self.versions = VersionWatch(path)
+        self._lock = threading.Lock()
+        self._version = None
+        self.reload()
+
+    def reload(self):
+        with self.pool.connection() as conn, conn:
+            # Version and rows from one snapshot
+            conn.execute("BEGIN")
+            version = read_version(conn, "masters")
+            rows = conn.execute("SELECT * FROM masters ORDER BY id").fetchall()
+
+        masters = [self._to_dict(r) for r in rows]
+        with self._lock:
+            self._set_index(masters)
+            self._version = version
+
+    def _refresh(self):
+        """
+        Reloads if another worker (or connection) changed the masters.
+        """
+        if self.versions.current("masters") != self._version:
+            self.reload()
+
+    @staticmethod
+    def _to_dict(row):
+        d = dict(row)
+        d["lab"] = np.array([d.pop("L"), d.pop("a"), d.pop("b")], dtype=np.float64)
+        return d
+
+    def _set_index(self, masters):
+        self._masters = masters
+        self._by_key = {
+            master_key(m["buyer"], m["contract"], m["colourway"]): m for m in masters
+        }
+        self._by_id = {m["id"]: m for m in masters}
+        self._labs = (
+            np.array([m["lab"] for m in masters]) if masters else np.empty((0, 3))
+        )
+        self._tree = kd_tree(self._labs) if masters else None
+        # For the ΔE00 -> ΔE76 bound in nearest()
+        self._max_chroma = float(np.hypot(self._labs[:, 1], self._labs[:, 2]).max(initial=0))
+        self._max_l_offset = float(np.abs(self._labs[:, 0] - 50).max(initial=0))
+
+    # ---------- writes ----------
+
+    def set_master(self, lab, buyer=None, contract=None, colourway=None, image_path=None):
+        """
+        Creates or replaces the master for a buyer/contract/colourway.
+        """
+        key = master_key(buyer, contract, colourway)
+        L, a, b = (float(v) for v in lab)
+        now = datetime.now().isoformat(timespec="seconds")
+
+        with self.pool.connection() as conn, conn:
+            conn.execute(
+                "INSERT INTO masters (buyer, contract, colourway, L, a, b, image_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (buyer, contract, colourway) DO UPDATE SET "
+                "L = excluded.L, a = excluded.a, b = excluded.b, "
+                "image_path = excluded.image_path, updated_at = excluded.updated_at",
+                (*key, L, a, b, image_path, now),
+            )
+            bump_version(conn, "masters")
+        self.reload()
+        return self.get(*key)
+
+    def delete(self, master_id):
+        with self.pool.connection() as conn, conn:
+            conn.execute("DELETE FROM masters WHERE id = ?", (int(master_id),))
+            bump_version(conn, "masters")
+        self.reload()
+
+    # ---------- lookups ----------
+
+    def get(self, buyer=None, contract=None, colourway=None):
+        self._refresh()
+        return self._by_key.get(master_key(buyer, contract, colourway))
+
+    def get_by_id(self, master_id):
+        self._refresh()
+        return self._by_id.get(int(master_id))
+
+    def all(self):
+        self._refresh()
+        return list(self._masters)
+
+    def __len__(self):
+        self._refresh()
+        return len(self._masters)
+
+    def nearest(self, lab, k=1, candidates=NEAREST_CANDIDATES):
+        """
+        k nearest masters to a Lab value by ΔE00.
+
+        The KD-tree (Euclidean, i.e. ΔE76) shortlists `candidates`
+        masters, which are ranked with exact ΔE00. Any master closer than
+        the k-th of those lies within delta_e76_radius of the query, so
+        the masters inside that radius are ranked too; the answer is
+        exact, not just likely.
+        Returns [(master, delta_e), ...] closest first.
+        """
+        self._refresh()
+        with self._lock:
+            masters, labs, tree = self._masters, self._labs, self._tree
+            max_chroma, max_l_offset = self._max_chroma, self._max_l_offset
+        if not masters:
+            return []
+
+        lab = np.asarray(lab, dtype=np.float64)
+        k = min(k, len(masters))
+        n = min(max(k, candidates), len(masters))
+
+        if tree is not None:
+            _, idx = tree.query(lab, k=n)
+            idx = np.atleast_1d(idx)
+        else:
+            d2 = ((labs - lab) ** 2).sum(axis=1)
+            idx = np.argpartition(d2, n - 1)[:n] if n < len(masters) else np.arange(len(masters))
+        de = np.atleast_1d(delta_e_2000_batch(labs[idx], lab))
+
+        if n < len(masters):
+            bound = chroma_weight_bound(
+                max(max_chroma, float(np.hypot(lab[1], lab[2]))),
+                max(max_l_offset, abs(float(lab[0]) - 50)),
+            )
+            # Slack for rounding in the ΔE00 / distance arithmetic
+            radius = delta_e76_radius(np.partition(de, k - 1)[k - 1], bound) * (1 + 1e-9) + 1e-9
+            if tree is not None:
+                wide = np.asarray(tree.query_ball_point(lab, radius), dtype=np.int64)
+            else:
+                wide = np.flatnonzero(d2 <= radius ** 2)
+            if len(wide) > n:
+                idx = wide
+                de = np.atleast_1d(delta_e_2000_batch(labs[idx], lab))
+
+        order = np.argsort(de, kind="stable")[:k]
+        return [(masters[idx[i]], float(de[i])) for i in order]
+
+
+_REGISTRY = None
+
+
+def get_registry():
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = MasterRegistry()
+    return _REGISTRY
@@ -0,0 +1,260 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# =================================================
+# METRICS (per-stage timers + Prometheus text exposition)
+# =================================================
+
+METRICS_ENABLED = os.environ.get("SHADE_QC_METRICS", "1") != "0"
+# Request header that turns on the per-request stage breakdown
+PROFILE_HEADER = "x-shade-qc-profile"
+
+# Seconds; covers sub-ms ΔE calls up to multi-second 24 MP uploads
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labels:
+            items = [((), 0)]
+        for values, v in items:
+            yield f"{self.name}{_label_str(self.labels, values)} {v}"
+
+
+class Gauge:
+    """
+    Value read at scrape time from a callback (no bookkeeping on the hot
+    path). kind="counter" exposes totals kept elsewhere, e.g. cache hits.
+    """
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name, self.help, self.fn, self.kind = name, help, fn, kind
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {self.fn()}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # labelvalues -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        names = self.labels + ("le",)
+        for values, s in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), s[:-1]):
+                cumulative += n
+                yield f"{self.name}_bucket{_label_str(names, values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_label_str(self.labels, values)} {s[-1]:.6f}"
+            yield f"{self.name}_count{_label_str(self.labels, values)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, kind="gauge"):
+        return self.register(Gauge(name, help, fn, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "shade_qc_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",)
+)
+REQUESTS = REGISTRY.counter(
+    "shade_qc_requests_total", "HTTP requests handled", ("method", "path", "status")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "shade_qc_request_duration_seconds", "HTTP request latency", ("method", "path")
+)
+
+_IN_PROGRESS = [0]
+REGISTRY.gauge(
+    "shade_qc_requests_in_progress", "HTTP requests currently being handled",
+    lambda: _IN_PROGRESS[0],
+)
+
+
+# ---------- stage timers ----------
+
+# [(stage, seconds)] for the current request when profiling is on, else None.
+# Executor jobs run inside a copy of the caller's context, so stages timed
+# in worker threads land in the same list.
+_PROFILE = ContextVar("shade_qc_profile", default=None)
+
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, name)
+    profile = _PROFILE.get()
+    if profile is not None:
+        profile.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the enclosed block as pipeline stage `name`. Stages may nest.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+def timed(name):
+    """
+    Decorator form of stage().
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_stage(name, time.perf_counter() - t0)
+        return wrapper
+    return decorate
+
+
+def server_timing(profile):
+    """
+    Stage list -> Server-Timing header value (durations in ms).
+    Repeated stages (e.g. per-page DB reads) are summed.
+    """
+    totals = {}
+    for name, seconds in profile:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+# ---------- ASGI middleware ----------
+
+class MetricsMiddleware:
+    """
+    Counts and times every HTTP request by route template.
+
+    A request sent with "X-Shade-QC-Profile: 1" gets the stages timed
+    while producing it back in a Server-Timing response header. For
+    streamed responses that covers the work done before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        profile = None
+        for key, value in scope["headers"]:
+            if key == PROFILE_HEADER.encode() and value not in (b"", b"0"):
+                profile = []
+        token = _PROFILE.set(profile)
+
+        status = [500]
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if profile is not None:
+                    elapsed = time.perf_counter() - t0
+                    header = server_timing(profile + [("total", elapsed)])
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode()),
+                    ]
+            await send(message)
+
+        _IN_PROGRESS[0] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _IN_PROGRESS[0] -= 1
+            _PROFILE.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                path = route.path
+            else:
+                path = scope["path"] if "endpoint" in scope else "unmatched"
+            REQUESTS.inc(scope["method"], path, status[0])
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, scope["method"], path)
+
+
+def render_metrics():
+    return REGISTRY.render()
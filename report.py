@@ -1,75 +1,153 @@
+import csv
+import io
 import os
 from datetime import datetime
-import pandas as pd
 
-from data_store import get_all_rolls
+from data_store import iter_rolls
 
+REPORT_COLUMNS = [
+    "Roll No", "Delta E", "Shade Group", "Image Name",
+    "Decision", "Quantity", "Lot", "Lot Group", "Date",
+]
+SUMMARY_COLUMNS = [
+    "Shade Group", "Rolls", "Quantity", "Avg Delta E", "Min Delta E", "Max Delta E",
+]
+PAGE_SIZE = 2000
 
-def generate_excel_report(report_path, buyer, contract):
+
+def report_rows(buyer=None, contract=None, date_from=None, date_to=None, lot=None):
+    """
+    Yields one report row (list) per roll, paged out of the roll store.
+    """
+    rolls = iter_rolls(
+        page_size=PAGE_SIZE, buyer=buyer, contract=contract,
+        date_from=date_from, date_to=date_to, lot=lot,
+    )
+    for r in rolls:
+        yield [
+            r["roll_no"],
+            r["delta_e"],
+            r["shade_group"],
+            os.path.basename(r["image_path"] or ""),
+            r["decision"],
+            r["quantity"],
+            r["lot"],
+            r["lot_group"],
+            r["date"],
+        ]
+
+
+class GroupSummary:
+    """
+    Running per-shade-group totals, updated row by row.
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, row):
+        _, delta_e, group, _, _, quantity = row[:6]
+        g = self.groups.setdefault(group, {"rolls": 0, "quantity": 0.0,
+                                           "de_sum": 0.0, "de_n": 0,
+                                           "de_min": None, "de_max": None})
+        g["rolls"] += 1
+        g["quantity"] += quantity or 0.0
+        if delta_e is not None:
+            g["de_sum"] += delta_e
+            g["de_n"] += 1
+            g["de_min"] = delta_e if g["de_min"] is None else min(g["de_min"], delta_e)
+            g["de_max"] = delta_e if g["de_max"] is None else max(g["de_max"], delta_e)
+
+    def rows(self):
+        for group in sorted(self.groups, key=str):
+            g = self.groups[group]
+            avg = round(g["de_sum"] / g["de_n"], 2) if g["de_n"] else None
+            yield [group, g["rolls"], g["quantity"], avg, g["de_min"], g["de_max"]]
+
+
+def generate_excel_report(report_path, buyer, contract, date_from=None, date_to=None, lot=None):
     """
     Generates Excel report with:
     - Buyer & Contract at top (once)
     - Roll-wise shade data below
-    """
-
-    rolls = get_all_rolls()
+    - Per shade group summary sheet
 
-    if not rolls:
-        return
-
-    # ---------------- TABLE DATA ----------------
-    table_data = []
-    for r in rolls:
-        table_data.append({
-            "Roll No": r["roll_no"],
-            "Delta E": r["delta_e"],
-            "Shade Group": r["shade_group"],
-            "Image Name": os.path.basename(r["image_path"])
-        })
-
-    df = pd.DataFrame(table_data)
-
-    # ---------------- WRITE EXCEL ----------------
-    with pd.ExcelWriter(report_path, engine="xlsxwriter") as writer:
-        workbook = writer.book
-        worksheet = workbook.add_worksheet("Shade Report")
-        writer.sheets["Shade Report"] = worksheet
-
-        # Formats
-        title_fmt = workbook.add_format({
-            "bold": True, "font_size": 14
-        })
-        header_fmt = workbook.add_format({
-            "bold": True, "border": 1
-        })
-        cell_fmt = workbook.add_format({
-            "border": 1
-        })
-
-        # ---------------- HEADER INFO ----------------
-        worksheet.write("A1", "Shade Grouping QC Report", title_fmt)
-
-        worksheet.write("A3", "Buyer Name:")
-        worksheet.write("B3", buyer)
-
-        worksheet.write("A4", "Contract No:")
-        worksheet.write("B4", contract)
-
-        worksheet.write("A5", "Report Date:")
-        worksheet.write("B5", datetime.now().strftime("%d-%m-%Y %H:%M"))
-
-        # ---------------- TABLE START ----------------
-        start_row = 7
-
-        for col, column_name in enumerate(df.columns):
-            worksheet.write(start_row, col, column_name, header_fmt)
-
-        for row_idx, row in df.iterrows():
-            for col_idx, value in enumerate(row):
-                worksheet.write(start_row + 1 + row_idx, col_idx, value, cell_fmt)
-
-        # ---------------- COLUMN WIDTH ----------------
-        worksheet.set_column("A:A", 15)
-        worksheet.set_column("B:B", 12)
-        worksheet.set_column("C:C", 15)
-        worksheet.set_column("D:D", 25)
+    Rows are paged from the store and written in xlsxwriter's
+    constant_memory mode, so memory use does not grow with the season.
+    report_path may be a path or a binary file object.
+    Returns the number of rolls written.
+    """
+    import xlsxwriter   # only needed for Excel, keep it off the import path
+
+    workbook = xlsxwriter.Workbook(report_path, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Shade Report")
+    summary_sheet = workbook.add_worksheet("Group Summary")
+
+    # Formats
+    title_fmt = workbook.add_format({
+        "bold": True, "font_size": 14
+    })
+    header_fmt = workbook.add_format({
+        "bold": True, "border": 1
+    })
+    cell_fmt = workbook.add_format({
+        "border": 1
+    })
+
+    # ---------------- COLUMN WIDTH ----------------
+    worksheet.set_column("A:A", 15)
+    worksheet.set_column("B:B", 12)
+    worksheet.set_column("C:C", 15)
+    worksheet.set_column("D:D", 25)
+    worksheet.set_column("E:I", 12)
+    summary_sheet.set_column("A:F", 14)
+
+    # ---------------- HEADER INFO ----------------
+    worksheet.write("A1", "Shade Grouping QC Report", title_fmt)
+
+    worksheet.write("A3", "Buyer Name:")
+    worksheet.write("B3", buyer)
+
+    worksheet.write("A4", "Contract No:")
+    worksheet.write("B4", contract)
+
+    worksheet.write("A5", "Report Date:")
+    worksheet.write("B5", datetime.now().strftime("%d-%m-%Y %H:%M"))
+
+    # ---------------- TABLE START ----------------
+    start_row = 7
+    worksheet.write_row(start_row, 0, REPORT_COLUMNS, header_fmt)
+
+    summary = GroupSummary()
+    count = 0
+    for row in report_rows(buyer, contract, date_from, date_to, lot):
+        count += 1
+        worksheet.write_row(start_row + count, 0, row, cell_fmt)
+        summary.add(row)
+
+    # ---------------- GROUP SUMMARY ----------------
+    summary_sheet.write("A1", "Shade Group Summary", title_fmt)
+    summary_sheet.write_row(2, 0, SUMMARY_COLUMNS, header_fmt)
+    for i, row in enumerate(summary.rows()):
+        summary_sheet.write_row(3 + i, 0, row, cell_fmt)
+
+    workbook.close()
+    return count
+
+
+def generate_csv_report(buyer=None, contract=None, date_from=None, date_to=None, lot=None):
+    """
+    Yields the roll report as CSV text chunks, one page of rows at a time.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(REPORT_COLUMNS)
+
+    for i, row in enumerate(report_rows(buyer, contract, date_from, date_to, lot), 1):
+        writer.writerow(["" if v is None else v for v in row])
+        if i % PAGE_SIZE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    yield buf.getvalue()
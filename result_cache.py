@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# =================================================
+# LAB STATS CACHE (keyed by image content + ROI params)
+# =================================================
+
+CACHE_SIZE = int(os.environ.get("SHADE_QC_CACHE_SIZE", "2048"))
+CACHE_MAX_AGE = float(os.environ.get("SHADE_QC_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# Optional JSON file the cache is loaded from / saved to
+CACHE_PATH = os.environ.get("SHADE_QC_CACHE_PATH") or None
+
+
+def make_key(data, roi=None, **params):
+    """
+    Content hash of the encoded image plus everything that changes the
+    Lab result (ROI and preprocessing parameters).
+    """
+    h = hashlib.blake2b(data, digest_size=20)
+    h.update(repr((roi, sorted(params.items()))).encode())
+    return h.hexdigest()
+
+
+class LabStatsCache:
+    """
+    Thread-safe LRU of extract_lab_stats output (mean, std) plus the
+    optional per-tile Lab means. A robust-mode mean (LabStats) is kept
+    whole so cache hits report the same stats.
+    Entries are evicted when over max_entries or older than max_age.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, max_age=CACHE_MAX_AGE, path=CACHE_PATH):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.path = path
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def get(self, key):
+        """
+        Returns (mean_lab, std_lab, tile_means) or None.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.time() - entry[0] > self.max_age:
+                del self._data[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            _, mean, std, tiles, stats = entry
+            mean = mean.copy() if stats is None else stats
+            return mean, std.copy(), None if tiles is None else tiles.copy()
+
+    def put(self, key, mean_lab, std_lab, tile_means=None):
+        if mean_lab is None:
+            return
+        from color_engine import LabStats
+
+        stats = mean_lab if isinstance(mean_lab, LabStats) else None
+        with self._lock:
+            self._data[key] = (
+                time.time(),
+                np.asarray(mean_lab, dtype=np.float32).copy(),
+                np.asarray(std_lab, dtype=np.float32).copy(),
+                None if tile_means is None else np.array(tile_means, dtype=np.float64),
+                stats,
+            )
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    # ---------- persistence ----------
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            entries = [
+                [key, ts, mean.tolist(), std.tolist(),
+                 None if tiles is None else tiles.tolist(),
+                 None if stats is None else stats.state()]
+                for key, (ts, mean, std, tiles, stats) in self._data.items()
+            ]
+        # Per-process temp file: several workers may save at shutdown
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path) as f:
+            entries = json.load(f)
+
+        now = time.time()
+        with self._lock:
+            # Files written before robust stats were cached have no stats column
+            for key, ts, mean, std, tiles, *stats in entries:
+                stats = stats[0] if stats else None
+                if stats is not None:
+                    from color_engine import LabStats
+                    stats = LabStats.from_state(stats)
+                if now - ts <= self.max_age:
+                    self._data[key] = (
+                        ts,
+                        np.array(mean, dtype=np.float32),
+                        np.array(std, dtype=np.float32),
+                        None if tiles is None else np.array(tiles, dtype=np.float64),
+                        stats,
+                    )
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+_CACHE = None
+
+
+def get_cache():
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = LabStatsCache()
+    return _CACHE
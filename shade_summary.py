@@ -2,8 +2,42 @@ from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QLabel, QScrollArea,
     QWidget, QGridLayout, QPushButton
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+from thumbnails import THUMB_SIZE, thumbnail_for
+
+COLUMNS = 3
+PRELOAD_ROWS = 2        # rows loaded beyond the visible ones
+KEEP_ROWS = 6           # pixmaps further than this from the viewport are dropped
+LOADER_THREADS = 2
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(int, int, QImage)   # generation, cell index, image
+
+
+class ThumbnailJob(QRunnable):
+    """
+    Fetches one cached thumbnail off the GUI thread (creating it on first
+    view). QImage is safe to build here; the dialog turns it into a
+    QPixmap on the GUI thread.
+    """
+
+    def __init__(self, dialog, generation, index, path):
+        super().__init__()
+        self.dialog = dialog
+        self.generation = generation
+        self.index = index
+        self.path = path
+
+    def run(self):
+        # Scrolled away (or dialog closed) before the job started
+        if not self.dialog.still_wanted(self.generation, self.index):
+            return
+        thumb = thumbnail_for(self.path)
+        image = QImage(thumb) if thumb else QImage()
+        self.dialog.signals.loaded.emit(self.generation, self.index, image)
 
 
 class ShadeSummaryDialog(QDialog):
@@ -13,6 +47,22 @@ class ShadeSummaryDialog(QDialog):
         self.setWindowTitle(f"Shade {shade_name} – Summary")
         self.setMinimumSize(800, 600)
 
+        self.image_paths = list(image_paths)
+        self._generation = 0
+        self._wanted = set()      # cells queued or loaded
+        self._loaded = set()      # cells showing a pixmap
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(LOADER_THREADS)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self._show_thumbnail)
+
+        # Coalesce bursts of scroll / resize events into one update
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(30)
+        self._update_timer.timeout.connect(self._update_visible)
+
         main_layout = QVBoxLayout(self)
 
         title = QLabel(f"Shade {shade_name} – All Captured Images")
@@ -21,26 +71,91 @@ class ShadeSummaryDialog(QDialog):
         main_layout.addWidget(title)
 
         # Scroll area
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
+        self.scroll = QScrollArea()
+        self.scroll.setWidgetResizable(True)
 
         container = QWidget()
         grid = QGridLayout(container)
         grid.setSpacing(12)
 
-        # Load images
-        for i, path in enumerate(image_paths):
-            img_label = QLabel()
+        # Fixed-size placeholders; thumbnails are filled in as they come into view
+        self.cells = []
+        for i in range(len(self.image_paths)):
+            img_label = QLabel("Loading…")
             img_label.setAlignment(Qt.AlignCenter)
-            pix = QPixmap(path).scaled(
-                220, 180, Qt.KeepAspectRatio, Qt.SmoothTransformation
-            )
-            img_label.setPixmap(pix)
-            grid.addWidget(img_label, i // 3, i % 3)
+            img_label.setFixedSize(*THUMB_SIZE)
+            grid.addWidget(img_label, i // COLUMNS, i % COLUMNS)
+            self.cells.append(img_label)
 
-        scroll.setWidget(container)
-        main_layout.addWidget(scroll)
+        self.scroll.setWidget(container)
+        main_layout.addWidget(self.scroll)
+        self.scroll.verticalScrollBar().valueChanged.connect(self._schedule_update)
 
         close_btn = QPushButton("Close")
         close_btn.clicked.connect(self.close)
         main_layout.addWidget(close_btn, alignment=Qt.AlignCenter)
+
+    # ---------- viewport tracking ----------
+
+    def _schedule_update(self, *_):
+        self._update_timer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._schedule_update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._schedule_update()
+
+    def _row_range(self, extra_rows):
+        """
+        Cell index range [first, last) within extra_rows of the viewport.
+        """
+        if not self.cells:
+            return 0, 0
+        row_height = THUMB_SIZE[1] + self.scroll.widget().layout().spacing()
+        top = self.scroll.verticalScrollBar().value()
+        bottom = top + self.scroll.viewport().height()
+        first_row = max(0, top // row_height - extra_rows)
+        last_row = bottom // row_height + 1 + extra_rows
+        return first_row * COLUMNS, min(len(self.cells), last_row * COLUMNS)
+
+    def _update_visible(self):
+        load_from, load_to = self._row_range(PRELOAD_ROWS)
+        keep_from, keep_to = self._row_range(KEEP_ROWS)
+
+        # Bounded memory: forget cells that are far away
+        for i in list(self._wanted):
+            if not keep_from <= i < keep_to:
+                self._wanted.discard(i)
+                if i in self._loaded:
+                    self._loaded.discard(i)
+                    self.cells[i].clear()
+                    self.cells[i].setText("Loading…")
+
+        for i in range(load_from, load_to):
+            if i not in self._wanted:
+                self._wanted.add(i)
+                self.pool.start(ThumbnailJob(self, self._generation, i, self.image_paths[i]))
+
+    def still_wanted(self, generation, index):
+        return generation == self._generation and index in self._wanted
+
+    def _show_thumbnail(self, generation, index, image):
+        if not self.still_wanted(generation, index):
+            return
+        cell = self.cells[index]
+        if image.isNull():
+            cell.setText("Image not found")
+            return
+        cell.setPixmap(QPixmap.fromImage(image))
+        self._loaded.add(index)
+
+    def done(self, result):
+        # Drop queued jobs; running ones finish and are ignored
+        self._generation += 1
+        self._wanted.clear()
+        self.pool.clear()
+        self.pool.waitForDone(2000)
+        super().done(result)
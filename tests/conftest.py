@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scratch database and no disk side effects; set before any app module is
+# imported, since they read their settings at import time
+WORK_DIR = tempfile.mkdtemp(prefix="shade_qc_tests_")
+os.environ["SHADE_QC_DB"] = os.path.join(WORK_DIR, "shade_qc.db")
+os.environ["SHADE_QC_ARCHIVE_UPLOADS"] = "0"
+os.environ["SHADE_QC_THUMBNAILS"] = "0"
+os.environ["SHADE_QC_WARMUP"] = "0"
+os.environ.pop("SHADE_QC_CACHE_PATH", None)
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))   # synthetic fabric images
+
+
+@pytest.fixture
+def store():
+    """
+    The roll store and master registry, emptied before each test.
+    """
+    from data_store import get_store
+    from master_registry import get_registry
+
+    registry = get_registry()
+    for master in registry.all():
+        registry.delete(master["id"])
+    get_store().clear()
+    return get_store()
+
+
+@pytest.fixture
+def fabric():
+    import synthetic
+
+    def encode(lab=synthetic.DEFAULT_LAB, seed=0, size=(240, 160)):
+        return synthetic.encode(synthetic.render_fabric(lab, *size, seed=seed))
+    return encode
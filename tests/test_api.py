@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+from fastapi import BackgroundTasks
+
+import api
+
+
+def test_stream_stores_rolls_before_sending_them(store, fabric):
+    from master_registry import get_registry
+
+    get_registry().set_master((55.0, 20.0, -30.0))
+    files = [(f"R{i}.jpg", fabric(seed=i)) for i in range(6)]
+    items = api.match_roll_metadata(files, None)
+
+    async def read_first_line():
+        stream = api.analyze_stream(items, None, False, BackgroundTasks())
+        line = await stream.__anext__()
+        await stream.aclose()     # client went away
+        return line
+
+    sent = json.loads(asyncio.run(read_first_line()))
+    assert sent["roll_no"] in {r["roll_no"] for r in store.query_rolls()}
+
+
+def test_analyze_does_not_block_the_event_loop_on_a_locked_database(store, fabric):
+    import sqlite3
+    import threading
+
+    import httpx
+    import main
+    from data_store import DB_PATH
+    from master_registry import get_registry
+
+    get_registry().set_master((55.0, 20.0, -30.0))
+    image = fabric(seed=1)
+
+    # Another writer holds the database for a second
+    writer = sqlite3.connect(DB_PATH, check_same_thread=False)
+    writer.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(1.0, writer.commit)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            request = asyncio.ensure_future(client.post(
+                "/analyze", data={"roll_no": "R1", "quantity": "10"},
+                files={"image": ("R1.jpg", image)},
+            ))
+            release.start()
+            worst, last = 0.0, asyncio.get_running_loop().time()
+            while not request.done():
+                await asyncio.sleep(0.01)
+                now = asyncio.get_running_loop().time()
+                worst, last = max(worst, now - last), now
+            return request.result(), worst
+
+    response, worst_gap = asyncio.run(run())
+    writer.close()
+    assert response.status_code == 200
+    assert worst_gap < 0.5
+
+
+def test_archive_paths_stay_in_the_upload_dir():
+    import os
+
+    root = os.path.abspath(api.UPLOAD_DIR)
+    for name in ("../../x/y", "/etc/passwd", "..", "a\\..\\b", "R 12/3", "", "master_..%2f"):
+        path = os.path.abspath(api.archive_path(name))
+        assert os.path.dirname(path) == root, name
+
+    assert api.archive_path("R-12.3_a") == os.path.join(api.UPLOAD_DIR, "R-12.3_a.jpg")
+    assert api.archive_path("R/1") != api.archive_path("R_1")
+
+
+def test_robust_mode_reports_lab_stats_from_cache_and_file(store, fabric, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    import color_engine
+    import main
+    from master_registry import get_registry
+    from result_cache import LabStatsCache, get_cache
+
+    monkeypatch.setattr(color_engine, "ROBUST_STATS", True)
+    get_registry().set_master((55.0, 20.0, -30.0))
+    image = fabric(seed=3)
+
+    with TestClient(main.app) as client:
+        def analyze(roll_no):
+            response = client.post(
+                "/analyze", data={"roll_no": roll_no, "quantity": "10"},
+                files={"image": (f"{roll_no}.jpg", image)},
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        hits = get_cache().hits
+        first, second = analyze("R1"), analyze("R2")
+
+    assert get_cache().hits == hits + 1
+    stats = first["lab_stats"]
+    assert stats is not None and second["lab_stats"] == stats
+    assert set(stats["percentiles"]) == {"p05", "p25", "p50", "p75", "p95"}
+    assert first["lab"] == stats["trimmed_mean"]
+
+    # The saved cache file keeps the full stats
+    path = str(tmp_path / "cache.json")
+    get_cache().save(path)
+    mean_lab, _, _ = LabStatsCache(path=path).get(api.cache_key(image))
+    assert mean_lab.to_dict() == stats
+
+
+def test_batch_rejects_bad_roll_metadata_before_streaming(store, fabric):
+    from fastapi.testclient import TestClient
+
+    import main
+    from master_registry import get_registry
+
+    get_registry().set_master((55.0, 20.0, -30.0))
+    image = fabric(seed=4)
+    bad = [
+        "not json",
+        '{"roll_no": "R1"}',
+        '["R1"]',
+        '[{"roll_no": "R1", "quantity": "ten"}]',
+        '[{"roll_no": "R1", "quantity": true}]',
+        '[{"roll_no": "R1", "buyer": {"name": "x"}}]',
+        '[{"roll_no": "R1", "filename": ["R1.jpg"]}]',
+    ]
+    with TestClient(main.app) as client:
+        for rolls in bad:
+            response = client.post(
+                "/analyze-batch", data={"rolls": rolls},
+                files=[("images", ("R1.jpg", image))],
+            )
+            assert response.status_code == 400, rolls
+
+        response = client.post(
+            "/analyze-batch",
+            data={"rolls": '[{"roll_no": "R1", "quantity": "12.5"}, {"roll_no": "R2"}]'},
+            files=[("images", ("a.jpg", image)), ("images", ("b.jpg", image))],
+        )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted((r["roll_no"], r["quantity"]) for r in lines) == [("R1", 12.5), ("R2", None)]
+    assert len(store.query_rolls()) == 2
+
+
+def test_stream_reports_worker_failures_by_type(store, fabric, monkeypatch):
+    import color_engine
+    from master_registry import get_registry
+
+    def broken(data):
+        raise MemoryError()
+
+    monkeypatch.setattr(color_engine, "analyze_image", broken)
+    get_registry().set_master((55.0, 20.0, -30.0))
+    items = api.match_roll_metadata([("R1.jpg", fabric(seed=17))], None)
+
+    async def read_all():
+        return [json.loads(line) async for line in
+                api.analyze_stream(items, None, False, BackgroundTasks())]
+
+    assert asyncio.run(read_all()) == [{"roll_no": "R1", "error": "Analysis failed: MemoryError"}]
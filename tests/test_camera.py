@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from camera import Camera, FakeSource
+
+
+class CountingSource(FakeSource):
+    """
+    FakeSource whose frame i is filled with i % 256 and, from frame
+    `resize_at` on, is `resize_to` (width, height) instead.
+    """
+
+    def __init__(self, resize_at=None, resize_to=(48, 32), **kwargs):
+        super().__init__(**kwargs)
+        self.frames = 0
+        self.resize_at = resize_at
+        self.resize_to = resize_to
+
+    def read(self, image=None):
+        if self.resize_at is not None and self.frames == self.resize_at:
+            self.width, self.height = self.resize_to
+        ok, image = super().read(image)
+        if ok:
+            image.fill(self.frames % 256)
+            self.frames += 1
+        return ok, image
+
+
+def open_camera(source, buffer_size=4, frames=12):
+    camera = Camera(source, buffer_size=buffer_size, fps=500)
+    assert camera.wait_for_frame(after=frames - 1, timeout=5)
+    return camera
+
+
+def test_ring_buffer_holds_the_last_frames_in_preallocated_slots():
+    source = CountingSource(width=64, height=48)
+    camera = open_camera(source)
+    buffer = camera._buffer
+    camera.release()
+
+    count = camera.frame_count
+    assert count == source.frames >= 12
+    assert buffer.shape == (4, 48, 64, 3) and camera._buffer is buffer
+    for i in range(count - 4, count):
+        assert (buffer[i % 4] == i % 256).all()
+    assert (camera.latest_frame() == (count - 1) % 256).all()
+
+
+def test_latest_frame_is_a_read_only_view():
+    camera = open_camera(FakeSource(width=64, height=48))
+    try:
+        frame = camera.latest_frame()
+        assert not frame.flags.writeable
+        assert np.shares_memory(frame, camera._buffer)
+        with pytest.raises(ValueError):
+            frame[0, 0, 0] = 0
+    finally:
+        camera.release()
+
+
+def test_get_frame_returns_an_owned_copy():
+    camera = open_camera(FakeSource(width=64, height=48))
+    try:
+        frame = camera.get_frame()
+        assert frame.flags.writeable and frame.shape == (48, 64, 3)
+        assert not np.shares_memory(frame, camera._buffer)
+    finally:
+        camera.release()
+
+
+def test_average_frames_reduces_sensor_noise():
+    camera = open_camera(FakeSource(width=160, height=120, noise=8.0), buffer_size=8)
+    camera.release()
+
+    single = camera.latest_frame().astype(np.float64)
+    average = camera.average_frames(4).astype(np.float64)
+    assert average.shape == single.shape
+    # Four frames of independent noise: about half the spread
+    assert average.std(axis=(0, 1)).max() < 0.65 * single.std(axis=(0, 1)).min()
+    np.testing.assert_allclose(average.mean(axis=(0, 1)), single.mean(axis=(0, 1)), atol=1.0)
+
+
+def test_frame_count_keeps_growing_across_a_resolution_change():
+    source = CountingSource(resize_at=6, resize_to=(48, 32), width=64, height=48)
+    camera = open_camera(source, frames=8)
+    camera.release()
+
+    assert camera.frame_count == source.frames >= 8
+    assert camera.latest_frame().shape == (32, 48, 3)
+
+    # Only frames of the new size are averaged
+    count = camera.frame_count
+    new_frames = np.arange(max(6, count - 3), count) % 256
+    average = camera.average_frames(8)
+    assert average.shape == (32, 48, 3)
+    assert (average == np.rint(new_frames.mean())).all()
@@ -0,0 +1,154 @@
+"""
+CIEDE2000 against the reference data of Sharma, Wu & Dalal (2005),
+"The CIEDE2000 color-difference formula: implementation notes,
+supplementary test data, and mathematical observations", and the
+histogram-based robust Lab stats against plain numpy on the pixels.
+"""
+import numpy as np
+import pytest
+
+from color_engine import (
+    PERCENTILES, ROBUST_TRIM, delta_e_2000, delta_e_2000_batch, histogram_lab_stats,
+)
+
+# (L1, a1, b1), (L2, a2, b2), ΔE00 — pairs 1-34 of the published table
+SHARMA_PAIRS = [
+    ((50.0000, 2.6772, -79.7751), (50.0000, 0.0000, -82.7485), 2.0425),
+    ((50.0000, 3.1571, -77.2803), (50.0000, 0.0000, -82.7485), 2.8615),
+    ((50.0000, 2.8361, -74.0200), (50.0000, 0.0000, -82.7485), 3.4412),
+    ((50.0000, -1.3802, -84.2814), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -1.1848, -84.8006), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -0.9009, -85.5211), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, 0.0000, 0.0000), (50.0000, -1.0000, 2.0000), 2.3669),
+    ((50.0000, -1.0000, 2.0000), (50.0000, 0.0000, 0.0000), 2.3669),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0009), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0010), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0011), 7.2195),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0012), 7.2195),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0009, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0010, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0011, -2.4900), 4.7461),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 0.0000, -2.5000), 4.3065),
+    ((50.0000, 2.5000, 0.0000), (73.0000, 25.0000, -18.0000), 27.1492),
+    ((50.0000, 2.5000, 0.0000), (61.0000, -5.0000, 29.0000), 22.8977),
+    ((50.0000, 2.5000, 0.0000), (56.0000, -27.0000, -3.0000), 31.9030),
+    ((50.0000, 2.5000, 0.0000), (58.0000, 24.0000, 15.0000), 19.4535),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.1736, 0.5854), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2972, 0.0000), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 1.8634, 0.5757), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2592, 0.3350), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+    ((61.2901, 3.7196, -5.3901), (61.4292, 2.2480, -4.9620), 1.8731),
+    ((35.0831, -44.1164, 3.7933), (35.0232, -40.0716, 1.5901), 1.8645),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((36.4612, 47.8580, 18.3852), (36.2715, 50.5065, 21.2231), 1.4146),
+    ((90.8027, -2.0831, 1.4410), (91.1528, -1.6435, 0.0447), 1.4441),
+    ((90.9257, -0.5406, -0.9208), (88.6381, -0.8985, -0.7239), 1.5381),
+    ((6.7747, -0.2908, -2.4247), (5.8714, -0.0985, -2.2286), 0.6377),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+# The table is given to 4 decimals
+TOLERANCE = 1e-4
+
+LAB1 = np.array([p[0] for p in SHARMA_PAIRS])
+LAB2 = np.array([p[1] for p in SHARMA_PAIRS])
+EXPECTED = np.array([p[2] for p in SHARMA_PAIRS])
+
+
+@pytest.mark.parametrize("lab1, lab2, expected", SHARMA_PAIRS)
+def test_delta_e_2000_reference_pairs(lab1, lab2, expected):
+    assert delta_e_2000(lab1, lab2) == pytest.approx(expected, abs=TOLERANCE)
+    # The formula is symmetric in its arguments
+    assert delta_e_2000(lab2, lab1) == pytest.approx(expected, abs=TOLERANCE)
+
+
+def test_delta_e_2000_batch_reference_pairs():
+    matrix = delta_e_2000_batch(LAB1, LAB2)
+    assert matrix.shape == (len(SHARMA_PAIRS), len(SHARMA_PAIRS))
+    np.testing.assert_allclose(np.diag(matrix), EXPECTED, atol=TOLERANCE)
+    np.testing.assert_allclose(delta_e_2000_batch(LAB2, LAB1), matrix.T, atol=1e-9)
+
+
+def test_delta_e_2000_batch_matches_scalar():
+    matrix = delta_e_2000_batch(LAB1, LAB2)
+    for i, lab1 in enumerate(LAB1):
+        for j in (0, i, len(LAB2) - 1):
+            assert matrix[i, j] == pytest.approx(delta_e_2000(lab1, LAB2[j]), abs=1e-9)
+
+
+def test_delta_e_2000_batch_shapes():
+    assert delta_e_2000_batch(LAB1, LAB2[0]).shape == (len(LAB1),)
+    assert delta_e_2000_batch(LAB1[0], LAB2).shape == (len(LAB2),)
+    assert delta_e_2000_batch(LAB1[0], LAB2[0]).shape == ()
+    assert delta_e_2000_batch(LAB1[:5], LAB2[:7]).shape == (5, 7)
+
+    # (N, 3) vs (3,) gives the reference values row by row
+    column = delta_e_2000_batch(LAB1[:6], LAB2[0])
+    np.testing.assert_allclose(column, EXPECTED[:6], atol=TOLERANCE)
+
+
+def test_delta_e_2000_identical_colours():
+    assert delta_e_2000_batch(LAB1, LAB1).diagonal() == pytest.approx(0.0, abs=1e-9)
+    assert isinstance(delta_e_2000(LAB1[0], LAB2[0]), float)
+
+
+# ---------- robust Lab stats ----------
+
+def lab_patch(specks=800, highlights=200, shape=(100, 200), seed=0):
+    """
+    8-bit Lab patch around L=130 with dark specks (L=20) and specular
+    highlights (L=252) scattered over it. Returns (patch, kept pixel mask).
+    """
+    rng = np.random.default_rng(seed)
+    n = shape[0] * shape[1]
+    pixels = np.clip(np.rint(rng.normal((130, 140, 110), (5, 3, 4), (n, 3))), 0, 255)
+    odd = rng.permutation(n)[:specks + highlights]
+    pixels[odd[:specks], 0] = 20
+    pixels[odd[specks:], 0] = 252
+    kept = np.ones(n, dtype=bool)
+    kept[odd] = False
+    return pixels.astype(np.uint8).reshape(*shape, 3), kept
+
+
+def test_histogram_stats_reject_specks_and_highlights():
+    patch, kept = lab_patch()
+    stats = histogram_lab_stats(patch)
+
+    assert stats.rejected == 1000 and stats.pixels == kept.sum()
+    assert stats.rejected_fraction == pytest.approx(0.05)
+
+    values = patch.reshape(-1, 3)[kept].astype(np.float64)
+    np.testing.assert_allclose(stats.mean, values.mean(axis=0), atol=1e-9)
+    np.testing.assert_allclose(stats.std, values.std(axis=0), atol=1e-6)
+
+
+def test_histogram_stats_percentiles_match_numpy():
+    patch, kept = lab_patch(seed=1)
+    stats = histogram_lab_stats(patch)
+    values = patch.reshape(-1, 3)[kept].astype(np.float64)
+
+    np.testing.assert_allclose(stats.median, np.median(values, axis=0), atol=1e-9)
+    np.testing.assert_allclose(
+        stats.percentiles, np.percentile(values, PERCENTILES, axis=0), atol=1e-9
+    )
+
+
+def test_histogram_stats_trimmed_mean():
+    patch, kept = lab_patch(seed=2)
+    stats = histogram_lab_stats(patch)
+
+    values = np.sort(patch.reshape(-1, 3)[kept].astype(np.float64), axis=0)
+    cut = round(len(values) * ROBUST_TRIM)     # 19000 kept pixels: a whole number
+    np.testing.assert_allclose(stats.trimmed_mean, values[cut:-cut].mean(axis=0), atol=1e-6)
+
+
+def test_histogram_stats_of_a_flat_patch_have_no_spread():
+    patch = np.full((50, 80, 3), (129, 140, 110), dtype=np.uint8)
+    stats = histogram_lab_stats(patch)
+
+    for value in (stats.mean, stats.median, stats.trimmed_mean, *stats.percentiles):
+        np.testing.assert_array_equal(value, [129, 140, 110])
+    np.testing.assert_array_equal(stats.std, 0)
+    assert stats.rejected == 0
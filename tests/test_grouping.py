@@ -0,0 +1,128 @@
+import numpy as np
+
+import data_store
+from grouping import LotGrouping, group_label, pairwise_delta_e
+
+
+def lot_rolls(n, seed=0, lot="L1"):
+    rng = np.random.default_rng(seed)
+    labs = np.array([55.0, 20.0, -30.0]) + rng.normal(0, 1.5, (n, 3))
+    return [
+        {"roll_no": f"{lot}-{i}", "lot": lot, "lab": lab, "quantity": 10.0,
+         "delta_e": float(i % 7), "shade_group": "ABCDE"[i % 5], "decision": "ACCEPT"}
+        for i, lab in enumerate(labs)
+    ]
+
+
+def assert_complete_linkage(labs, labels, tolerance):
+    dist = pairwise_delta_e(labs)
+    for g in set(labels.tolist()):
+        members = np.flatnonzero(labels == g)
+        assert dist[np.ix_(members, members)].max() <= tolerance + 1e-4
+
+
+def test_lot_grouping_keeps_every_pair_within_tolerance():
+    labs = np.array([r["lab"] for r in lot_rolls(300)])
+    grouping = LotGrouping(1.5)
+    assert_complete_linkage(labs, grouping.fit(labs), 1.5)
+
+
+def test_add_keeps_existing_groups_and_tolerance():
+    labs = np.array([r["lab"] for r in lot_rolls(300, seed=1)])
+    grouping = LotGrouping(1.5)
+    before = grouping.fit(labs[:200]).copy()
+    grouping.add(labs[200:])
+
+    assert (grouping.labels[:200] == before).all()
+    assert_complete_linkage(labs, grouping.labels, 1.5)
+
+    restored = LotGrouping.restore(labs[:200], before, 1.5)
+    restored.add(labs[200:])
+    assert (restored.labels == grouping.labels).all()
+
+
+def test_perform_grouping_leaves_master_bands_alone(store):
+    rolls = lot_rolls(40) + lot_rolls(25, seed=2, lot="L2")
+    store.add_rolls(rolls)
+    bands_before = store.rollup_stats(by="shade_group")
+
+    data_store.perform_grouping(tolerance=1.5)
+
+    stored = store.query_rolls()
+    assert [r["shade_group"] for r in stored] == [r["shade_group"] for r in rolls]
+    assert store.rollup_stats(by="shade_group") == bands_before
+    assert all(r["lot_group"] for r in stored)
+
+    counts = {}
+    for r in stored:
+        counts[(r["lot"], r["lot_group"])] = counts.get((r["lot"], r["lot_group"]), 0) + 1
+    stats = data_store.lot_group_stats()
+    assert {(s["lot"], s["lot_group"]): s["rolls"] for s in stats} == counts
+    assert {s["lot_group"] for s in data_store.lot_group_stats("L2")} <= {
+        group_label(i) for i in range(25)
+    }
+
+
+def test_new_rolls_join_existing_lot_groups(store):
+    rolls = lot_rolls(60, seed=3)
+    store.add_rolls(rolls[:40])
+    data_store.perform_grouping(tolerance=1.5, lot="L1")
+    first = {r["roll_no"]: r["lot_group"] for r in store.query_rolls()}
+
+    store.add_rolls(rolls[40:])
+    data_store.perform_grouping(tolerance=1.5, lot="L1")
+    after = {r["roll_no"]: r["lot_group"] for r in store.query_rolls()}
+
+    assert all(after[k] == v for k, v in first.items())
+    assert all(after[r["roll_no"]] for r in rolls[40:])
+    assert sum(s["rolls"] for s in data_store.lot_group_stats("L1")) == 60
+
+
+def test_clustering_does_not_hold_the_write_lock(store, monkeypatch):
+    import sqlite3
+
+    import grouping
+
+    store.add_rolls(lot_rolls(80, seed=4))
+    cluster_rolls = grouping.cluster_rolls
+    calls = []
+
+    def cluster_while_others_write(rolls, tolerance, lot_grouping=None):
+        # Another worker can write meanwhile (fails with "database is
+        # locked" if perform_grouping held the lock) ...
+        other = sqlite3.connect(data_store.DB_PATH, timeout=0.2)
+        with other:
+            other.execute("BEGIN IMMEDIATE")
+            if not calls:
+                # ... and here it regroups the lot, so this pass must be redone
+                data_store.bump_version(other, data_store.lot_version_name("L1"))
+        other.close()
+        calls.append(len(rolls))
+        return cluster_rolls(rolls, tolerance, lot_grouping)
+
+    monkeypatch.setattr(grouping, "cluster_rolls", cluster_while_others_write)
+    data_store.perform_grouping(tolerance=1.5, lot="L1")
+
+    assert calls == [80, 80]
+    stored = store.query_rolls()
+    assert all(r["lot_group"] for r in stored)
+    assert sum(s["rolls"] for s in data_store.lot_group_stats("L1")) == 80
+
+
+def test_rolls_without_a_lot_and_an_empty_lot_name_keep_separate_groupings(store, monkeypatch):
+    assert data_store.lot_version_name(None) != data_store.lot_version_name("")
+
+    store.add_rolls(lot_rolls(30, seed=5, lot=None) + lot_rolls(30, seed=6, lot=""))
+    data_store.perform_grouping(tolerance=1.5)
+
+    # Both cached groupings are still current: nothing is rebuilt
+    restored = []
+    restore = LotGrouping.restore.__func__
+    monkeypatch.setattr(LotGrouping, "restore", classmethod(
+        lambda cls, *args: restored.append(args) or restore(cls, *args)
+    ))
+    store.add_rolls([dict(r, roll_no=f"new-{i}") for i, r in enumerate(lot_rolls(5, seed=7, lot=""))])
+    data_store.perform_grouping(tolerance=1.5)
+
+    assert restored == []
+    assert all(r["lot_group"] for r in store.query_rolls())
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import live
+from live import LiveMonitor
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 20))
+
+
+def test_readings_reach_every_subscriber():
+    async def scenario():
+        monitor = LiveMonitor("fake", hz=20)
+        queues = [monitor.subscribe(), monitor.subscribe()]
+        readings = [await asyncio.wait_for(q.get(), 5) for q in queues]
+        for q in queues:
+            await monitor.unsubscribe(q)
+        return monitor, readings
+
+    monitor, readings = run(scenario())
+    for reading in readings:
+        assert len(reading["lab"]) == 3 and reading["frame"] > 0
+    assert monitor.camera is None and monitor._task is None
+
+
+def test_client_joining_while_the_last_one_leaves_gets_readings():
+    async def scenario():
+        monitor = LiveMonitor("fake", hz=20)
+        first = monitor.subscribe()
+        await asyncio.wait_for(first.get(), 5)
+
+        # A page reload: the old socket closes, the new one opens while
+        # the measuring loop is still being torn down
+        leaving = asyncio.ensure_future(monitor.unsubscribe(first))
+        await asyncio.sleep(0)
+        second = monitor.subscribe()
+        await leaving
+
+        reading = await asyncio.wait_for(second.get(), 3)
+        await monitor.unsubscribe(second)
+        return reading
+
+    assert "lab" in run(scenario())
+
+
+def test_a_failing_loop_tells_its_clients(monkeypatch):
+    def broken(frame, *args):
+        raise RuntimeError("sensor on fire")
+
+    monkeypatch.setattr(live, "analyze_image", broken)
+
+    async def scenario():
+        monitor = LiveMonitor("fake", hz=20)
+        q = monitor.subscribe()
+        reading = await asyncio.wait_for(q.get(), 5)
+        await monitor.unsubscribe(q)
+        return reading
+
+    reading = run(scenario())
+    assert "RuntimeError" in reading["error"]
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_frames_are_averaged_off_the_event_loop(monkeypatch, kind):
+    import threading
+
+    from camera import Camera
+    from workers import AnalysisExecutor
+
+    averaged_on = []
+    average_frames = Camera.average_frames
+
+    def spy(self, n=4):
+        averaged_on.append(threading.current_thread() is threading.main_thread())
+        return average_frames(self, n)
+
+    monkeypatch.setattr(Camera, "average_frames", spy)
+    executor = AnalysisExecutor(kind, max_workers=1, max_pending=2)
+    monkeypatch.setattr(live, "get_executor", lambda: executor)
+
+    async def scenario():
+        monitor = LiveMonitor("fake", hz=20)
+        q = monitor.subscribe()
+        reading = await asyncio.wait_for(q.get(), 30)
+        await monitor.unsubscribe(q)
+        return reading
+
+    try:
+        assert "lab" in run(scenario())
+    finally:
+        executor.shutdown()
+    assert averaged_on and not any(averaged_on)
+
+
+def test_live_websocket_reports_shade_against_the_master(store, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from master_registry import get_registry
+
+    get_registry().set_master((55.0, 20.0, -30.0))
+    monkeypatch.setattr(live, "_MONITOR", LiveMonitor("fake", hz=20))
+
+    with TestClient(main.app) as client, client.websocket_connect("/ws/live") as ws:
+        reading = ws.receive_json()
+
+    assert reading["shade_group"] and reading["delta_e"] >= 0
+    assert reading["master"]["lab"] == [55.0, 20.0, -30.0]
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import master_registry
+from color_engine import delta_e_2000_batch
+from master_registry import MasterRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = MasterRegistry(str(tmp_path / "masters.db"))
+    yield registry
+    registry.pool.close()
+    registry.versions.close()
+
+
+def fill(registry, labs):
+    with registry.pool.connection() as conn, conn:
+        conn.executemany(
+            "INSERT INTO masters (buyer, contract, colourway, L, a, b) VALUES (?, '', '', ?, ?, ?)",
+            [(f"B{i}", *lab) for i, lab in enumerate(labs)],
+        )
+    registry.reload()
+
+
+def test_masters_are_found_by_key_and_id(registry):
+    default = registry.set_master((55.0, 20.0, -30.0))
+    acme = registry.set_master((60.0, 10.0, 5.0), buyer="acme", contract="C1", colourway="navy")
+
+    assert registry.get()["id"] == default["id"]
+    assert registry.get("acme", "C1", "navy")["id"] == acme["id"]
+    assert registry.get("acme", "C1") is None
+    assert registry.get_by_id(acme["id"])["buyer"] == "acme"
+    assert registry.get_by_id(9999) is None
+    assert len(registry) == 2
+
+    # Setting the same key again replaces the master in place
+    again = registry.set_master((61.0, 11.0, 6.0), buyer="acme", contract="C1", colourway="navy")
+    assert again["id"] == acme["id"] and list(again["lab"]) == [61.0, 11.0, 6.0]
+
+    registry.delete(acme["id"])
+    assert registry.get("acme", "C1", "navy") is None and len(registry) == 1
+
+
+def test_rolls_fall_back_to_the_default_master(store):
+    from fastapi import HTTPException
+
+    import api
+    from master_registry import get_registry
+
+    with pytest.raises(HTTPException) as missing:
+        api.resolve_master((55.0, 20.0, -30.0), buyer="acme")
+    assert missing.value.status_code == 400
+
+    default = get_registry().set_master((55.0, 20.0, -30.0))
+    acme = get_registry().set_master((60.0, 10.0, 5.0), buyer="acme")
+    assert api.resolve_master((55.0, 20.0, -30.0), buyer="acme")["id"] == acme["id"]
+    assert api.resolve_master((55.0, 20.0, -30.0), buyer="zenith")["id"] == default["id"]
+    assert api.resolve_master((60.0, 10.0, 5.0), nearest=True)["id"] == acme["id"]
+
+
+def test_unknown_master_id_is_a_404(store, fabric):
+    from fastapi.testclient import TestClient
+
+    import main
+    from master_registry import get_registry
+
+    get_registry().set_master((55.0, 20.0, -30.0))
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/analyze", data={"roll_no": "R1", "quantity": "10", "master_id": "9999"},
+            files={"image": ("R1.jpg", fabric(seed=22))},
+        )
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("use_tree", [True, False])
+def test_nearest_matches_a_brute_force_search(registry, monkeypatch, use_tree):
+    if not use_tree:
+        monkeypatch.setattr(master_registry, "kd_tree", lambda points: None)
+
+    # 8-bit OpenCV Lab, as the pipeline measures it: high raw chroma is
+    # where ΔE76 and ΔE00 rankings disagree most
+    rng = np.random.default_rng(11)
+    labs = rng.uniform((40, 90, 90), (220, 170, 170), (500, 3))
+    fill(registry, labs)
+    ids = np.array([m["id"] for m in registry.all()])
+
+    for probe in rng.uniform((40, 90, 90), (220, 170, 170), (500, 3)):
+        de = delta_e_2000_batch(labs, probe)
+        expected = ids[np.argsort(de, kind="stable")[:3]]
+
+        found = registry.nearest(probe, k=3)
+        assert [m["id"] for m, _ in found] == list(expected)
+        assert [d for _, d in found] == pytest.approx(np.sort(de)[:3])
+
+
+def test_nearest_with_fewer_masters_than_asked(registry):
+    fill(registry, [(50, 128, 128), (60, 130, 120)])
+    found = registry.nearest((55, 129, 125), k=5)
+    assert [m["buyer"] for m, _ in found] == ["B1", "B0"]
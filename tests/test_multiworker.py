@@ -0,0 +1,248 @@
+"""
+Multi-worker consistency: `uvicorn main:app --workers N` on a scratch
+database, and perform_grouping() from several processes at once.
+
+Slow (starts real worker processes); skip with `pytest -m "not slow"`.
+"""
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import synthetic
+
+pytestmark = pytest.mark.slow
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 3
+ROUNDS = 6         # master changes
+PER_ROUND = 12     # analyses per master
+CONCURRENCY = 6
+TOLERANCE = 1.5
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---------- server ----------
+
+class Server:
+    """
+    uvicorn with N workers on a scratch directory. Clients use a fresh
+    connection per request so the kernel spreads them over the workers.
+    """
+
+    def __init__(self, workers, work_dir):
+        import httpx
+
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            SHADE_QC_DB=os.path.join(work_dir, "shade_qc.db"),
+            SHADE_QC_ARCHIVE_UPLOADS="0",
+            SHADE_QC_THUMBNAILS="0",
+            SHADE_QC_WARMUP="0",
+        )
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=work_dir, env=env,
+        )
+        self.client = httpx.Client(
+            base_url=self.url, timeout=60,
+            limits=httpx.Limits(max_keepalive_connections=0),
+        )
+
+    def wait_ready(self, workers, timeout=60):
+        """
+        Until every worker has answered /ready with 200.
+        """
+        import httpx
+
+        ready = set()
+        deadline = time.monotonic() + timeout
+        while len(ready) < workers:
+            assert time.monotonic() < deadline, f"only {len(ready)}/{workers} workers ready"
+            assert self.proc.poll() is None, "server exited"
+            try:
+                pid = self.client.get("/health").json()["pid"]
+                if self.client.get("/ready").status_code == 200:
+                    ready.add(pid)
+            except httpx.TransportError:
+                time.sleep(0.2)
+        return ready
+
+    def post(self, path, image, **fields):
+        r = self.client.post(path, data=fields, files={"image": ("img.jpg", image)})
+        while r.status_code == 503:   # analysis backpressure
+            time.sleep(0.05)
+            r = self.client.post(path, data=fields, files={"image": ("img.jpg", image)})
+        r.raise_for_status()
+        return r.json()
+
+    def get(self, path, **params):
+        r = self.client.get(path, params=params)
+        r.raise_for_status()
+        return r.json()
+
+    def stop(self):
+        self.client.close()
+        self.proc.terminate()
+        self.proc.wait(30)
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = Server(WORKERS, str(tmp_path))
+    try:
+        server.wait_ready(WORKERS)
+        yield server
+    finally:
+        server.stop()
+
+
+def fabric(lab, seed):
+    return synthetic.encode(synthetic.render_fabric(lab, 480, 320, seed=seed))
+
+
+def test_workers_agree_on_masters_and_results(server):
+    pool = ThreadPoolExecutor(CONCURRENCY)
+    roll = fabric(synthetic.DEFAULT_LAB, seed=99)
+    served_by = set()
+    analysed = 0
+
+    for i in range(ROUNDS):
+        # Alternate between two clearly different masters
+        lab = (55.0 + (i % 2) * 10, 20.0, -30.0 + (i % 2) * 8)
+        master = server.post("/set-master", fabric(lab, seed=i))["master"]
+
+        results = list(pool.map(
+            lambda n: server.post("/analyze", roll, roll_no=f"R{i}-{n}", quantity="10"),
+            range(PER_ROUND),
+        ))
+        analysed += len(results)
+        for res in results:
+            assert res["master"] == master, f"round {i} analysed against a stale master"
+
+        served_by |= {server.get("/health")["pid"] for _ in range(4 * WORKERS)}
+
+    assert len(served_by) > 1, "requests never reached more than one worker"
+
+    # Every worker must see the same rolls and rollups
+    summaries = list(pool.map(lambda _: server.get("/stats/summary"), range(4 * WORKERS)))
+    pool.shutdown()
+    assert all(summary["rolls"] == analysed for summary in summaries)
+    assert all(summary == summaries[0] for summary in summaries)
+
+    seen, cursor = 0, None
+    while True:
+        page = server.get("/rolls", limit=100, **({"cursor": cursor} if cursor else {}))
+        seen += len(page["rolls"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == analysed
+
+
+# ---------- lot grouping across processes ----------
+
+def _group_worker(args):
+    db_path, calls, tolerance = args
+    os.environ["SHADE_QC_DB"] = db_path
+    import data_store
+
+    for _ in range(calls):
+        data_store.perform_grouping(tolerance=tolerance, lot="L1")
+        time.sleep(0.01)
+
+
+def _add_rolls(db_path, labs, start):
+    from data_store import RollStore
+
+    store = RollStore(db_path)
+    store.add_rolls(
+        {"roll_no": f"G{start + i}", "lot": "L1", "lab": lab, "quantity": 1.0}
+        for i, lab in enumerate(labs)
+    )
+    store.pool.close()
+
+
+def lot_assignments(db_path):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT r.roll_no, r.lot_group, g.group_index, r.L, r.a, r.b "
+        "FROM rolls r LEFT JOIN lot_groups g ON g.roll_id = r.id ORDER BY r.id"
+    ).fetchall()
+    rollups = conn.execute(
+        "SELECT lot_group, rolls FROM lot_group_rollups ORDER BY lot_group"
+    ).fetchall()
+    conn.close()
+    return rows, rollups
+
+
+@pytest.fixture(scope="module")
+def grouping_labs():
+    rng = np.random.default_rng(5)
+    return np.asarray(synthetic.DEFAULT_LAB) + rng.normal(0, 1.2, (600, 3))
+
+
+def test_grouping_while_rolls_arrive(tmp_path, grouping_labs):
+    from color_engine import delta_e_2000_batch
+    from grouping import group_label
+
+    db = str(tmp_path / "grouping.db")
+    ctx = multiprocessing.get_context("spawn")
+
+    # Rolls arrive in batches while every process keeps grouping
+    with ctx.Pool(WORKERS) as pool:
+        pending = pool.map_async(_group_worker, [(db, 15, TOLERANCE)] * WORKERS)
+        for start in range(0, len(grouping_labs), 50):
+            _add_rolls(db, grouping_labs[start:start + 50], start)
+            time.sleep(0.02)
+        pending.get(300)
+    # A last pass picks up rolls added after the workers finished
+    with ctx.Pool(1) as pool:
+        pool.map(_group_worker, [(db, 1, TOLERANCE)])
+
+    rows, rollups = lot_assignments(db)
+    assert all(r[2] is not None for r in rows), "some rolls were never grouped"
+    assert all(r[1] == group_label(r[2]) for r in rows)
+
+    groups = {}
+    for r in rows:
+        groups.setdefault(r[2], []).append(r[3:])
+    for members in groups.values():
+        members = np.asarray(members)
+        worst = max(float(np.max(delta_e_2000_batch(members, m))) for m in members)
+        assert worst <= TOLERANCE + 1e-3
+
+    counts = {}
+    for r in rows:
+        counts[r[1]] = counts.get(r[1], 0) + 1
+    assert dict(rollups) == counts
+
+
+def test_concurrent_grouping_matches_a_single_process(tmp_path, grouping_labs):
+    ctx = multiprocessing.get_context("spawn")
+
+    results = []
+    for procs in (1, WORKERS):
+        db = str(tmp_path / f"grouping_{procs}.db")
+        _add_rolls(db, grouping_labs, 0)
+        with ctx.Pool(procs) as pool:
+            pool.map(_group_worker, [(db, 3, TOLERANCE)] * procs)
+        results.append(lot_assignments(db))
+    assert results[0] == results[1]
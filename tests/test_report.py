@@ -0,0 +1,174 @@
+import csv
+import io
+import os
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import pytest
+
+import data_store
+import report
+
+
+FILTERS = [
+    {},
+    {"buyer": "acme"},
+    {"buyer": "zenith", "contract": "C1"},
+    {"date_from": "2026-03-02", "date_to": "2026-03-04"},
+    {"contract": "C0", "date_to": "2026-03-02"},
+    {"lot": "L2"},
+]
+
+
+def season(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rolls = []
+    for i in range(n):
+        rolls.append({
+            "roll_no": f"R{i}",
+            "lot": ["L1", "L2", None][i % 3],
+            "contract": f"C{i % 2}",
+            "buyer": ["acme", "zenith", None][i % 3 - 1],
+            "supplier": "north",
+            "date": f"2026-03-{1 + i % 5:02d}",
+            "image_path": None if i % 9 == 0 else f"IMAGES/2026/R{i}.jpg",
+            "lab": np.array([55.0, 20.0, -30.0]) + rng.normal(0, 1.5, 3),
+            "delta_e": None if i % 11 == 0 else round(float(rng.uniform(0, 6)), 3),
+            "shade_group": None if i % 13 == 0 else "ABC"[i % 3],
+            "decision": ["ACCEPT", "HOLD", "REJECT"][i % 3],
+            "quantity": None if i % 7 == 0 else float(10 + i % 4),
+        })
+    return rolls
+
+
+@pytest.fixture
+def rolls(store, monkeypatch):
+    # Small pages, so paging and chunking are exercised on a small table
+    monkeypatch.setattr(report, "PAGE_SIZE", 7)
+    store.add_rolls(season(60))
+    data_store.perform_grouping(tolerance=1.5)
+    return store.query_rolls()
+
+
+def select(rolls, buyer=None, contract=None, date_from=None, date_to=None, lot=None):
+    return [
+        r for r in rolls
+        if (buyer is None or r["buyer"] == buyer)
+        and (contract is None or r["contract"] == contract)
+        and (date_from is None or r["date"] >= date_from)
+        and (date_to is None or r["date"] <= date_to)
+        and (lot is None or r["lot"] == lot)
+    ]
+
+
+def csv_row(r):
+    image = os.path.basename(r["image_path"] or "")
+    row = [r["roll_no"], r["delta_e"], r["shade_group"], image, r["decision"],
+           r["quantity"], r["lot"], r["lot_group"], r["date"]]
+    return ["" if v is None else str(v) for v in row]
+
+
+def read_sheet(xlsx, name):
+    """
+    Cell values of one worksheet as {(row, col): value}, 0-based. Reads
+    the xlsx XML directly: strings are str, numbers float.
+    """
+    ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    rel = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+    with zipfile.ZipFile(xlsx) as z:
+        workbook = ElementTree.fromstring(z.read("xl/workbook.xml"))
+        rels = ElementTree.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+        targets = {r.get("Id"): r.get("Target") for r in rels}
+        (sheet,) = [s for s in workbook.iter(f"{{{ns['m']}}}sheet") if s.get("name") == name]
+        xml = ElementTree.fromstring(z.read("xl/" + targets[sheet.get(rel)]))
+        shared = []
+        if "xl/sharedStrings.xml" in z.namelist():
+            strings = ElementTree.fromstring(z.read("xl/sharedStrings.xml"))
+            shared = ["".join(t.text or "" for t in si.iter(f"{{{ns['m']}}}t"))
+                      for si in strings.findall("m:si", ns)]
+
+    cells = {}
+    for c in xml.iter(f"{{{ns['m']}}}c"):
+        ref = c.get("r")
+        letters = ref.rstrip("0123456789")
+        col = sum((ord(ch) - 64) * 26 ** i for i, ch in enumerate(reversed(letters))) - 1
+        row = int(ref[len(letters):]) - 1
+        kind = c.get("t")
+        if kind == "inlineStr":
+            cells[row, col] = "".join(t.text or "" for t in c.iter(f"{{{ns['m']}}}t"))
+        elif c.find("m:v", ns) is not None:
+            value = c.find("m:v", ns).text
+            cells[row, col] = shared[int(value)] if kind == "s" else float(value)
+    return cells
+
+
+def sheet_rows(cells, first_row, width):
+    last = max(r for r, _ in cells)
+    return [[cells.get((r, c)) for c in range(width)] for r in range(first_row, last + 1)]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_csv_report_lists_the_filtered_rolls(rolls, filters):
+    chunks = list(report.generate_csv_report(**filters))
+    expected = select(rolls, **filters)
+
+    got = list(csv.reader(io.StringIO("".join(chunks))))
+    assert got[0] == report.REPORT_COLUMNS
+    assert got[1:] == [csv_row(r) for r in expected]
+    # One chunk per full page of rows, plus the remainder
+    assert len(chunks) == len(expected) // report.PAGE_SIZE + 1
+    assert any(r["lot_group"] for r in expected) or not expected
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_excel_report_rows_and_group_summary_match_the_rolls(rolls, filters):
+    buyer, contract = filters.get("buyer"), filters.get("contract")
+    dates = {k: v for k, v in filters.items() if k not in ("buyer", "contract")}
+    expected = select(rolls, **filters)
+
+    f = io.BytesIO()
+    assert report.generate_excel_report(f, buyer, contract, **dates) == len(expected)
+
+    cells = read_sheet(f, "Shade Report")
+    assert sheet_rows(cells, 7, 9)[0] == report.REPORT_COLUMNS
+    written = sheet_rows(cells, 8, 9) if expected else []
+    assert [[r[0], r[2], r[7]] for r in written] == [
+        [r["roll_no"], r["shade_group"], r["lot_group"]] for r in expected
+    ]
+
+    summary = read_sheet(f, "Group Summary")
+    assert sheet_rows(summary, 2, 6)[0] == report.SUMMARY_COLUMNS
+    by_group = {}
+    for row in sheet_rows(summary, 3, 6) if expected else []:
+        by_group[row[0]] = row[1:]
+
+    assert sum(v[0] for v in by_group.values()) == len(expected)
+    for group in {r["shade_group"] for r in expected}:
+        members = [r for r in expected if r["shade_group"] == group]
+        measured = [r["delta_e"] for r in members if r["delta_e"] is not None]
+        n, quantity, avg, low, high = by_group[group]
+        assert n == len(members), group
+        assert quantity == pytest.approx(sum(r["quantity"] or 0.0 for r in members)), group
+        if measured:
+            assert avg == pytest.approx(sum(measured) / len(measured), abs=0.005), group
+            assert (low, high) == (min(measured), max(measured)), group
+        else:
+            assert avg is low is high is None, group
+
+
+def test_report_endpoint_streams_csv_and_rejects_unknown_formats(rolls):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        response = client.get("/report", params={"format": "csv", "buyer": "acme"})
+        bad = client.get("/report", params={"format": "pdf"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    got = list(csv.reader(io.StringIO(response.text)))
+    assert got[1:] == [csv_row(r) for r in select(rolls, buyer="acme")]
+    assert bad.status_code == 400
@@ -0,0 +1,154 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import data_store
+from data_store import rollup_increments, write_rollups
+
+
+ROLLUP_TABLES = {
+    "roll_rollups": "dim, key, shade_group, decision",
+    "roll_delta_e_bins": "dim, key, bin",
+    "lot_group_rollups": "lot, lot_group",
+}
+
+
+def mixed_rolls(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rolls = []
+    for i in range(n):
+        delta_e = None if i % 11 == 0 else float(rng.uniform(0, 14))
+        rolls.append({
+            "roll_no": f"R{seed}-{i}",
+            "lot": ["L1", "L2", None][i % 3],
+            "contract": f"C{i % 2}",
+            "buyer": ["acme", "zenith", None][i % 3 - 1],
+            "supplier": ["north", "south"][i % 2],
+            "date": f"2026-03-{1 + i % 5:02d}",
+            "lab": np.array([55.0, 20.0, -30.0]) + rng.normal(0, 1.5, 3),
+            "delta_e": delta_e,
+            "shade_group": None if i % 13 == 0 else "ABCDE"[i % 5],
+            "decision": ["ACCEPT", "HOLD", "REJECT"][i % 3],
+            "quantity": None if i % 7 == 0 else float(10 + i % 4),
+        })
+    return rolls
+
+
+def rollup_tables(store):
+    with store.pool.connection() as conn:
+        return {
+            table: [tuple(r) for r in conn.execute(f"SELECT * FROM {table} ORDER BY {key}")]
+            for table, key in ROLLUP_TABLES.items()
+        }
+
+
+def assert_matches_rebuild(store):
+    """
+    The incrementally kept rollups equal a fresh rebuild from the rolls.
+    """
+    incremental = rollup_tables(store)
+    store.rebuild_rollups()
+    rebuilt = rollup_tables(store)
+
+    for table in ROLLUP_TABLES:
+        assert len(incremental[table]) == len(rebuilt[table]), table
+        for got, want in zip(incremental[table], rebuilt[table]):
+            assert got == pytest.approx(want), table
+
+
+def test_rollups_follow_adds_regrouping_and_clear(store):
+    store.add_rolls(mixed_rolls(90))
+    store.add_rolls(mixed_rolls(40, seed=1))
+    assert_matches_rebuild(store)
+
+    data_store.perform_grouping(tolerance=1.5)
+    assert_matches_rebuild(store)
+
+    # A new tolerance moves every roll to another lot group
+    store.add_rolls(mixed_rolls(30, seed=2))
+    data_store.perform_grouping(tolerance=3.0)
+    assert_matches_rebuild(store)
+
+    store.clear()
+    assert all(not rows for rows in rollup_tables(store).values())
+    store.add_rolls(mixed_rolls(20, seed=3))
+    assert_matches_rebuild(store)
+
+
+def test_negative_increments_drop_emptied_rows(store):
+    store.add_rolls(mixed_rolls(60))
+    leaving = [r for r in store.query_rolls() if r["buyer"] == "acme"]
+
+    with store.write_transaction() as conn:
+        rows = store._select_ids(conn, [r["id"] for r in leaving])
+        groups, bins = rollup_increments(rows, sign=-1)
+        conn.executemany("DELETE FROM rolls WHERE id = ?", [(r["id"],) for r in leaving])
+        write_rollups(conn, groups, bins)
+
+    tables = rollup_tables(store)
+    assert not [r for r in tables["roll_rollups"] if r[4] <= 0]
+    assert not [r for r in tables["roll_rollups"] if r[:2] == ("buyer", "acme")]
+    assert_matches_rebuild(store)
+
+
+def test_rollup_stats_agree_with_the_rolls(store):
+    store.add_rolls(mixed_rolls(120))
+    rolls = store.query_rolls()
+
+    def expected(selected):
+        measured = [r["delta_e"] for r in selected if r["delta_e"] is not None]
+        return len(selected), sum(r["quantity"] or 0.0 for r in selected), \
+            sum(measured) / len(measured)
+
+    for filters, selected in [
+        ({}, rolls),
+        ({"buyer": "zenith"}, [r for r in rolls if r["buyer"] == "zenith"]),
+        ({"supplier": "south"}, [r for r in rolls if r["supplier"] == "south"]),
+        ({"date_from": "2026-03-02", "date_to": "2026-03-04"},
+         [r for r in rolls if "2026-03-02" <= r["date"] <= "2026-03-04"]),
+    ]:
+        (summary,) = store.rollup_stats(**filters)
+        n, quantity, mean_de = expected(selected)
+        assert summary["rolls"] == n, filters
+        assert summary["quantity"] == pytest.approx(quantity), filters
+        assert summary["avg_delta_e"] == pytest.approx(mean_de, abs=1e-3), filters
+
+    by_group = {e["key"]: e["rolls"] for e in store.rollup_stats(by="shade_group")}
+    assert by_group == Counter(r["shade_group"] for r in rolls)
+    assert sum(b["rolls"] for b in store.delta_e_distribution()) == sum(
+        1 for r in rolls if r["delta_e"] is not None
+    )
+
+
+@pytest.mark.parametrize("params", [
+    {"by": "shade_group", "buyer": "acme", "supplier": "north"},
+    {"by": "buyer", "supplier": "north"},
+    {"by": "supplier", "date_from": "2026-03-01"},
+    {"by": "day", "buyer": "acme"},
+    {"by": "colour"},
+])
+def test_breakdown_rejects_filters_the_rollups_cannot_answer(store, params):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        response = client.get("/stats/breakdown", params=params)
+    assert response.status_code == 400
+
+
+def test_breakdown_allows_filters_on_its_own_dimension(store):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    store.add_rolls(mixed_rolls(30))
+    with TestClient(main.app) as client:
+        by_buyer = client.get("/stats/breakdown", params={"by": "buyer", "buyer": "acme"})
+        by_day = client.get("/stats/breakdown", params={"by": "day", "date_to": "2026-03-02"})
+
+    assert by_buyer.status_code == 200
+    assert [e["key"] for e in by_buyer.json()] == ["acme"]
+    assert by_day.status_code == 200
+    assert sorted(e["key"] for e in by_day.json()) == ["2026-03-01", "2026-03-02"]
@@ -0,0 +1,80 @@
+"""
+Startup budget: `import main` stays light and a fresh worker is ready
+quickly. Both run in a new interpreter so nothing is imported already.
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "cv2", "scipy", "xlsxwriter", "pandas", "PyQt5")
+
+# Several times what a laptop needs, so only real regressions trip them
+IMPORT_BUDGET_S = 2.0
+READY_BUDGET_S = 5.0
+
+PROBE = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+imported = time.perf_counter() - t0
+heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+
+from fastapi.testclient import TestClient
+with TestClient(main.create_app(warmup=True)) as client:
+    t0 = time.perf_counter()
+    while True:
+        status = client.get("/ready").json()
+        if status["status"] != "starting":
+            break
+        time.sleep(0.005)
+    ready = time.perf_counter() - t0
+
+print(json.dumps({{"import_s": imported, "heavy": heavy, "ready_s": ready, "status": status}}))
+"""
+
+
+def run_probe(work_dir, db_path=None):
+    db_path = db_path or os.path.join(work_dir, "startup.db")
+    out = subprocess.check_output(
+        [sys.executable, "-c", PROBE], cwd=work_dir, text=True, timeout=120,
+        env=dict(os.environ, PYTHONPATH=ROOT, SHADE_QC_DB=db_path),
+    )
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_startup_is_light_and_fast(tmp_path):
+    result = run_probe(str(tmp_path))
+
+    # Heavy modules load in the lifespan, never on import
+    assert result["heavy"] == []
+    assert result["import_s"] < IMPORT_BUDGET_S
+    assert result["status"]["status"] == "ready", result["status"]["error"]
+    assert result["ready_s"] < READY_BUDGET_S
+
+
+def test_failed_startup_is_reported_not_waited_on(tmp_path):
+    # A directory cannot be opened as the database
+    result = run_probe(str(tmp_path), db_path=str(tmp_path))
+
+    assert result["status"]["status"] == "failed"
+    assert "OperationalError" in result["status"]["error"]
+    assert result["ready_s"] < READY_BUDGET_S
+
+
+def test_upload_dir_is_only_created_when_archiving(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import api
+    import main
+
+    monkeypatch.chdir(tmp_path)
+    with TestClient(main.create_app(warmup=False)):
+        pass
+    assert not os.path.exists(api.UPLOAD_DIR)
+
+    monkeypatch.setattr(api, "ARCHIVE_UPLOADS", True)
+    with TestClient(main.create_app(warmup=False)):
+        pass
+    assert os.path.isdir(api.UPLOAD_DIR)
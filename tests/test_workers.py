@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from workers import AnalysisExecutor, ExecutorSaturated
+
+
+def test_executor_refuses_work_beyond_max_pending():
+    executor = AnalysisExecutor("thread", max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = executor.submit(release.wait, 5)
+        assert executor.pending == 1
+        with pytest.raises(ExecutorSaturated):
+            executor.submit(sum, [1, 2])
+        assert executor.pending == 1     # the refused job left no trace
+
+        release.set()
+        assert await blocked is True
+        await asyncio.sleep(0.01)        # done callback runs on the pool thread
+        assert executor.pending == 0
+        return await executor.run(sum, [1, 2])
+
+    try:
+        assert asyncio.run(scenario()) == 3
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_analyze_answers_503_with_retry_after_when_saturated(store, fabric, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import api
+    import main
+    from master_registry import get_registry
+
+    get_registry().set_master((55.0, 20.0, -30.0))
+    executor = AnalysisExecutor("thread", max_workers=1, max_pending=1)
+    monkeypatch.setattr(api, "get_executor", lambda: executor)
+    release = threading.Event()
+
+    async def occupy():
+        # The only slot, as a long upload already being analysed would
+        executor.submit(release.wait, 10)
+
+    try:
+        with TestClient(main.app) as client:
+            client.portal.call(occupy)
+            response = client.post(
+                "/analyze", data={"roll_no": "R1", "quantity": "10"},
+                files={"image": ("R1.jpg", fabric(seed=21))},
+            )
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "1"
+
+            release.set()
+            deadline = time.monotonic() + 5
+            while executor.pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+            response = client.post(
+                "/analyze", data={"roll_no": "R1", "quantity": "10"},
+                files={"image": ("R1.jpg", fabric(seed=21))},
+            )
+            assert response.status_code == 200
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+
+import cv2
+
+from color_engine import load_image
+
+# =================================================
+# THUMBNAIL CACHE (on disk, keyed by image content hash)
+# =================================================
+
+THUMB_DIR = os.environ.get("SHADE_QC_THUMB_DIR", os.path.join("IMAGES", ".thumbs"))
+THUMB_SIZE = (220, 180)      # max width, height (ShadeSummaryDialog cell)
+THUMB_QUALITY = 85
+# Create thumbnails when uploads are archived, not only on first view
+THUMBS_ON_UPLOAD = os.environ.get("SHADE_QC_THUMBNAILS", "1") != "0"
+
+# (path, mtime, size) -> content hash, so a file is hashed once per process
+_HASHES = {}
+_HASH_LOCK = threading.Lock()
+
+
+def image_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def thumb_path(key, thumb_dir=None):
+    return os.path.join(thumb_dir or THUMB_DIR, key[:2], f"{key}.jpg")
+
+
+def render_thumbnail(data, size=THUMB_SIZE):
+    """
+    Encoded image bytes -> BGR thumbnail fitting inside size, or None.
+    Decodes at the largest JPEG reduction that still covers the box.
+    """
+    img = None
+    for reduce in (8, 4, 2, 1):
+        img = load_image(data, reduce)
+        if img is None:
+            return None
+        h, w = img.shape[:2]
+        if w >= size[0] or h >= size[1] or reduce == 1:
+            break
+
+    h, w = img.shape[:2]
+    scale = min(size[0] / w, size[1] / h, 1.0)
+    if scale < 1:
+        img = cv2.resize(
+            img, (max(1, round(w * scale)), max(1, round(h * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    return img
+
+
+def save_thumbnail(data, thumb_dir=None):
+    """
+    Writes the thumbnail of encoded image bytes into the cache (if it is
+    not there yet) and returns its path, or None if the image is unreadable.
+    """
+    path = thumb_path(image_hash(data), thumb_dir)
+    if os.path.exists(path):
+        return path
+
+    thumb = render_thumbnail(data)
+    if thumb is None:
+        return None
+
+    ok, buf = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+    if not ok:
+        return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(buf.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def thumbnail_for(image_path, thumb_dir=None):
+    """
+    Cached thumbnail path for an image file, created on first request.
+    Returns None if the file is missing or unreadable. Safe to call from
+    worker threads.
+    """
+    try:
+        st = os.stat(image_path)
+    except OSError:
+        return None
+
+    sig = (image_path, st.st_mtime_ns, st.st_size)
+    with _HASH_LOCK:
+        key = _HASHES.get(sig)
+    if key is not None:
+        path = thumb_path(key, thumb_dir)
+        if os.path.exists(path):
+            return path
+
+    with open(image_path, "rb") as f:
+        data = f.read()
+    with _HASH_LOCK:
+        _HASHES[sig] = image_hash(data)
+    return save_thumbnail(data, thumb_dir)
@@ -0,0 +1,133 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from metrics import REGISTRY, record_stage
+
+# =================================================
+# ANALYSIS EXECUTOR (keeps CPU work off the event loop)
+# =================================================
+
+# "thread" or "process". OpenCV releases the GIL for blur / colour
+# conversion, so threads are the cheaper default.
+EXECUTOR_KIND = os.environ.get("SHADE_QC_EXECUTOR", "thread")
+MAX_WORKERS = int(os.environ.get("SHADE_QC_WORKERS", "0")) or (os.cpu_count() or 1)
+# Jobs allowed in flight (running + waiting) before new work is refused
+MAX_PENDING = int(os.environ.get("SHADE_QC_MAX_PENDING", "0")) or MAX_WORKERS * 4
+
+
+REJECTED = REGISTRY.counter(
+    "shade_qc_executor_rejected_total", "Analysis jobs refused because the pool was full"
+)
+
+
+def _timed_job(submitted, fn, *args):
+    record_stage("queue_wait", time.perf_counter() - submitted)
+    return fn(*args)
+
+
+class ExecutorSaturated(Exception):
+    """
+    Raised when the pool already holds MAX_PENDING jobs.
+    """
+
+
+class AnalysisExecutor:
+    """
+    Bounded thread / process pool for the colour analysis pipeline.
+
+    submit() never queues without limit: once max_pending jobs are in
+    flight it raises ExecutorSaturated so the caller can send a 503.
+    """
+
+    def __init__(self, kind=EXECUTOR_KIND, max_workers=MAX_WORKERS, max_pending=MAX_PENDING):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="shade-qc"
+                )
+        return self._pool
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                REJECTED.inc()
+                raise ExecutorSaturated(
+                    f"{self._pending} analysis jobs already in flight"
+                )
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args):
+        """
+        Schedules fn(*args) on the pool and returns an asyncio future.
+        Raises ExecutorSaturated straight away if the pool is full.
+
+        Thread jobs run in a copy of the caller's context, so their stage
+        timings reach the caller's request profile.
+        """
+        self._acquire()
+        try:
+            if self.kind == "thread":
+                ctx = contextvars.copy_context()
+                future = self._get_pool().submit(
+                    ctx.run, _timed_job, time.perf_counter(), fn, *args
+                )
+            else:
+                future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn, *args):
+        """
+        Runs fn(*args) on the pool and awaits the result.
+        """
+        return await self.submit(fn, *args)
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+_EXECUTOR = None
+
+
+def get_executor():
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = AnalysisExecutor()
+    return _EXECUTOR
+
+
+def shutdown_executor():
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown()
+        _EXECUTOR = None